@@ -1,16 +1,32 @@
 # app/api.py
+import json
+from contextlib import asynccontextmanager
+from datetime import date
+
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Any, Dict, List, Optional
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
 
 from app.domain import orchestrator
+from app.domain.feedback_jobs import QueueFullError
+from app.domain.memory import store
+from app.domain.memory.records import to_jsonable
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Flush write-behind user state before the instance is shut down
+    store.close()
+
 
 app = FastAPI(title="StudyFlow Concierge API")
 
 from fastapi import FastAPI
 # ...your existing imports...
 
-app = FastAPI(title="Studyflow Concierge Agent")
+app = FastAPI(title="Studyflow Concierge Agent", lifespan=lifespan)
 
 @app.get("/")
 async def root():
@@ -21,8 +37,16 @@ async def root():
         "endpoints": {
             "POST /setup_user": "Initialize user profile, courses, tasks",
             "POST /plan_day": "Plan study blocks for a given day",
+            "POST /plan_day_stream": "Plan a day as server-sent events (blocks, then summary text)",
+            "POST /plan_range": "Plan study blocks for several days at once",
             "POST /reflect": "Log reflection & get feedback",
+            "GET  /reflect_feedback": "Deferred reflection feedback by job id",
+            "POST /reflect_stream": "Reflect as server-sent events (result, then feedback text)",
             "GET  /status": "View current study status",
+            "GET  /plan": "Stored plan for a date",
+            "GET  /plan_diff": "Changes to a stored plan since a version",
+            "GET  /llm_cache_stats": "LLM response cache hit/miss counters",
+            "GET  /llm_usage": "LLM token counters per endpoint and user",
         },
     }
 
@@ -33,6 +57,17 @@ async def root():
 
 # ---------- Request models ----------
 
+def _iso_date(value: Optional[str]) -> Optional[str]:
+    # Dates are stored as day ordinals, so a bad one must fail here (422)
+    # rather than halfway through a state update
+    if value is not None:
+        try:
+            date.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+    return value
+
+
 class Course(BaseModel):
     course_id: str
     name: str
@@ -43,12 +78,30 @@ class Task(BaseModel):
     course_id: str
     title: str
     deadline_date: str
-    status: Optional[str] = "pending"
+    status: Optional[Literal["pending", "in_progress", "done"]] = "pending"
+    estimated_minutes: int = Field(0, ge=0)
+    min_block_minutes: int = Field(0, ge=0)
+    preferred_time: Optional[Literal["morning", "afternoon", "evening"]] = None
+    remaining_minutes: Optional[int] = Field(None, ge=0)
+
+    _check_deadline = field_validator("deadline_date")(_iso_date)
+
+
+class Window(BaseModel):
+    start: str
+    end: str
 
 
 class Profile(BaseModel):
-    preferred_block_minutes: int = 45
-    max_blocks_per_day: int = 2
+    preferred_block_minutes: int = Field(45, ge=1)
+    max_blocks_per_day: int = Field(2, ge=1)
+    # Spacing between blocks: a gap after each, a longer break after
+    # every `break_every` blocks in a row (0 = none)
+    gap_minutes: int = Field(0, ge=0)
+    break_every: int = Field(0, ge=0)
+    break_minutes: int = Field(0, ge=0)
+    # Study windows the nightly job plans the next day with
+    default_windows: Optional[List[Window]] = None
 
 
 class SetupPayload(BaseModel):
@@ -57,18 +110,44 @@ class SetupPayload(BaseModel):
     tasks: List[Task]
     profile: Profile
 
-
-class Window(BaseModel):
-    start: str
-    end: str
+    @field_validator("tasks")
+    @classmethod
+    def _unique_task_ids(cls, tasks: List[Task]) -> List[Task]:
+        seen = set()
+        for task in tasks:
+            if task.task_id in seen:
+                raise ValueError(f"Duplicate task_id {task.task_id!r}")
+            seen.add(task.task_id)
+        return tasks
 
 
 class PlanPayload(BaseModel):
     user_id: str
     date: str
     available_windows: List[Window]
+    busy_windows: List[Window] = []
     session_id: Optional[str] = None
 
+    _check_date = field_validator("date")(_iso_date)
+
+
+class PlanRangePayload(BaseModel):
+    user_id: str
+    start_date: str
+    end_date: str
+    windows_by_day: Dict[str, List[Window]] = {}
+    default_windows: Optional[List[Window]] = None
+    session_id: Optional[str] = None
+
+    _check_dates = field_validator("start_date", "end_date")(_iso_date)
+
+    @field_validator("windows_by_day")
+    @classmethod
+    def _check_days(cls, value: Dict[str, List[Window]]) -> Dict[str, List[Window]]:
+        for day in value:
+            _iso_date(day)
+        return value
+
 
 class ReflectPayload(BaseModel):
     user_id: str
@@ -77,9 +156,22 @@ class ReflectPayload(BaseModel):
     difficulty_rating: int
     notes: str
     date: Optional[str] = None
+    minutes_spent: Dict[str, int] = {}
+    # Return right away and generate feedback in the background
+    # (fetch it from /reflect_feedback with the returned job id)
+    defer_feedback: bool = False
+
+    _check_date = field_validator("date")(_iso_date)
+
+
+# Longest /reflect_feedback long-poll, in seconds
+MAX_FEEDBACK_WAIT = 30.0
 
 
 # ---------- Endpoints ----------
+# Routes that call the LLM are async: they await Gemini on the event loop
+# instead of holding a threadpool worker for the round trip. Store-only
+# routes stay sync and run briefly on the threadpool.
 
 @app.post("/setup_user")
 def setup_user(payload: SetupPayload) -> Dict[str, Any]:
@@ -91,38 +183,159 @@ def setup_user(payload: SetupPayload) -> Dict[str, Any]:
             "profile": payload.profile.model_dump(),
         },
     )
-    return result
+    return to_jsonable(result)
 
 
-@app.post("/plan_day")
-def plan_day(payload: PlanPayload) -> Dict[str, Any]:
-    result = orchestrator.plan_day(
-        payload.user_id,
-        {
-            "date": payload.date,
-            "available_windows": [w.model_dump() for w in payload.available_windows],
-            "session_id": payload.session_id,
-        },
+def _plan_day_args(payload: PlanPayload) -> Dict[str, Any]:
+    return {
+        "date": payload.date,
+        "available_windows": [w.model_dump() for w in payload.available_windows],
+        "busy_windows": [w.model_dump() for w in payload.busy_windows],
+        "session_id": payload.session_id,
+    }
+
+
+def _reflect_args(payload: ReflectPayload) -> Dict[str, Any]:
+    return {
+        "completed_task_ids": payload.completed_task_ids,
+        "partial_task_ids": payload.partial_task_ids,
+        "difficulty_rating": payload.difficulty_rating,
+        "notes": payload.notes,
+        "date": payload.date,
+        "minutes_spent": payload.minutes_spent,
+        "defer_feedback": payload.defer_feedback,
+    }
+
+
+async def _event_stream(events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> StreamingResponse:
+    """
+    Server-sent events from (event, data) pairs. The first event is
+    produced before the response starts, so a ValueError from the
+    request still becomes a 400 instead of a broken stream.
+    """
+    try:
+        first = await events.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def body():
+        event, data = first
+        yield f"event: {event}\ndata: {json.dumps(to_jsonable(data))}\n\n"
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(to_jsonable(data))}\n\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # Proxies must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    return result
+
+
+@app.post("/plan_day")
+async def plan_day(payload: PlanPayload) -> Dict[str, Any]:
+    try:
+        result = await orchestrator.plan_day_async(payload.user_id, _plan_day_args(payload))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return to_jsonable(result)
+
+
+@app.post("/plan_day_stream")
+async def plan_day_stream(payload: PlanPayload) -> StreamingResponse:
+    """
+    Events: `plan` (blocks, right after scheduling), `summary` (pieces of
+    the LLM summary as they arrive), `done` (stored plan version).
+    """
+    return await _event_stream(orchestrator.plan_day_stream(payload.user_id, _plan_day_args(payload)))
+
+
+@app.post("/plan_range")
+async def plan_range(payload: PlanRangePayload) -> Dict[str, Any]:
+    try:
+        result = await orchestrator.plan_range_async(
+            payload.user_id,
+            {
+                "start_date": payload.start_date,
+                "end_date": payload.end_date,
+                "windows_by_day": {
+                    day: [w.model_dump() for w in windows]
+                    for day, windows in payload.windows_by_day.items()
+                },
+                "default_windows": (
+                    [w.model_dump() for w in payload.default_windows]
+                    if payload.default_windows is not None
+                    else None
+                ),
+                "session_id": payload.session_id,
+            },
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return to_jsonable(result)
 
 
 @app.post("/reflect")
-def reflect(payload: ReflectPayload) -> Dict[str, Any]:
-    result = orchestrator.reflect(
-        payload.user_id,
-        {
-            "completed_task_ids": payload.completed_task_ids,
-            "partial_task_ids": payload.partial_task_ids,
-            "difficulty_rating": payload.difficulty_rating,
-            "notes": payload.notes,
-            "date": payload.date,
-        },
-    )
-    return result
+async def reflect(payload: ReflectPayload) -> Dict[str, Any]:
+    try:
+        result = await orchestrator.reflect_async(payload.user_id, _reflect_args(payload))
+    except QueueFullError as e:
+        # Backpressure: nothing was saved, the client should retry later
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    return to_jsonable(result)
+
+
+@app.get("/reflect_feedback")
+async def get_reflect_feedback(user_id: str, job_id: str, wait: float = 0.0) -> Dict[str, Any]:
+    """
+    A deferred feedback job: status "queued", "running" or "done" (with
+    feedback_text). With `wait` (seconds, max MAX_FEEDBACK_WAIT) the call
+    returns as soon as the job is done, so clients need not poll.
+    """
+    job = await orchestrator.get_feedback_job(user_id, job_id, min(max(wait, 0.0), MAX_FEEDBACK_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No feedback job {job_id}")
+    return to_jsonable(job)
+
+
+@app.post("/reflect_stream")
+async def reflect_stream(payload: ReflectPayload) -> StreamingResponse:
+    """
+    Events: `reflection` (updated profile, plan patch), `feedback`
+    (pieces of the LLM feedback), `done`.
+    """
+    return await _event_stream(orchestrator.reflect_stream(payload.user_id, _reflect_args(payload)))
 
 
 @app.get("/status")
 def get_status(user_id: str) -> Dict[str, Any]:
-    return orchestrator.get_status(user_id)
+    return to_jsonable(orchestrator.get_status(user_id))
+
+
+@app.get("/plan")
+def get_plan(user_id: str, date: str) -> Dict[str, Any]:
+    plan = orchestrator.get_plan(user_id, date)
+    if plan is None:
+        raise HTTPException(status_code=404, detail=f"No plan stored for {date}")
+    return to_jsonable(plan)
+
+
+@app.get("/plan_diff")
+def get_plan_diff(user_id: str, date: str, since_version: int = 0) -> Dict[str, Any]:
+    diff = orchestrator.get_plan_diff(user_id, date, since_version)
+    if diff is None:
+        raise HTTPException(status_code=404, detail=f"No plan stored for {date}")
+    return to_jsonable(diff)
+
+
+@app.get("/llm_cache_stats")
+async def get_llm_cache_stats() -> Dict[str, Any]:
+    return orchestrator.get_llm_cache_stats()
+
 
+@app.get("/llm_usage")
+def get_llm_usage(user_id: Optional[str] = None) -> Dict[str, Any]:
+    usage = orchestrator.get_llm_usage(user_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail=f"No LLM usage recorded for {user_id}")
+    return usage
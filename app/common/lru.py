@@ -0,0 +1,72 @@
+# app/common/lru.py
+
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Iterator, List, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """
+    Values by string key in least-recently-used order.
+
+    The budget is a number of entries (`max_entries`) and/or an approximate
+    number of bytes (`max_bytes`, from the sizes given to `put`); 0
+    disables a limit. The cache never evicts by itself: the owner asks for
+    `eviction_candidates` and decides what it can safely drop. Not
+    thread-safe; owners hold their own lock.
+    """
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._values: "OrderedDict[str, V]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def keys(self) -> List[str]:
+        return list(self._values)
+
+    def get(self, key: str) -> Optional[V]:
+        """Return the cached value and mark it most recently used."""
+        value = self._values.get(key)
+        if value is not None:
+            self._values.move_to_end(key)
+        return value
+
+    def peek(self, key: str) -> Optional[V]:
+        """Return the cached value without touching its recency."""
+        return self._values.get(key)
+
+    def put(self, key: str, value: V, size: int | None = None) -> None:
+        """
+        Insert or refresh a value. `size` (bytes) updates the byte
+        accounting; None keeps the previous estimate.
+        """
+        self._values[key] = value
+        self._values.move_to_end(key)
+        if size is not None:
+            self.total_bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+
+    def discard(self, key: str) -> Optional[V]:
+        """Remove a key from the cache, returning its value if present."""
+        self.total_bytes -= self._sizes.pop(key, 0)
+        return self._values.pop(key, None)
+
+    def over_budget(self) -> bool:
+        if self.max_entries and len(self._values) > self.max_entries:
+            return True
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            return True
+        return False
+
+    def eviction_candidates(self) -> Iterator[str]:
+        """Yield keys from coldest to hottest."""
+        return iter(list(self._values))
@@ -1,6 +1,7 @@
 # app/config/settings.py
 
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load variables from .env into environment
@@ -19,3 +20,152 @@ def get_gemini_api_key() -> str:
             "GEMINI_API_KEY=your_key_here"
         )
     return api_key
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float from the environment, falling back to `default`."""
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise RuntimeError(f"{name} must be a number, got {value!r}")
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an int from the environment, falling back to `default`."""
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RuntimeError(f"{name} must be an integer, got {value!r}")
+
+
+# ---------- User state store ----------
+
+def get_store_backend() -> str:
+    """
+    Which storage backend holds user state: "memory" (default) or "sqlite".
+    """
+    return os.environ.get("STUDYFLOW_STORE_BACKEND", "memory").strip().lower()
+
+
+def get_sqlite_path() -> str:
+    """Path of the SQLite database file used by the "sqlite" backend."""
+    return os.environ.get("STUDYFLOW_SQLITE_PATH", "studyflow.db")
+
+
+def get_store_flush_interval() -> float:
+    """Seconds between write-behind flushes of dirty user states."""
+    return _env_float("STUDYFLOW_STORE_FLUSH_INTERVAL", 1.0)
+
+
+def get_store_flush_batch_size() -> int:
+    """Number of dirty users that triggers an early flush."""
+    return _env_int("STUDYFLOW_STORE_FLUSH_BATCH", 256)
+
+
+def get_store_refresh_interval() -> float:
+    """
+    Seconds a cached user is served before it is compared with the SQLite
+    database again, to pick up writes from other processes.
+    """
+    return _env_float("STUDYFLOW_STORE_REFRESH_INTERVAL", 1.0)
+
+
+def get_journal_snapshot_every() -> int:
+    """Journal events per user after which a compacting snapshot is written."""
+    return _env_int("STUDYFLOW_JOURNAL_SNAPSHOT_EVERY", 100)
+
+
+def get_cache_max_users() -> int:
+    """Max users kept in memory before cold ones are evicted (0 = unbounded)."""
+    return _env_int("STUDYFLOW_CACHE_MAX_USERS", 0)
+
+
+def get_cache_max_bytes() -> int:
+    """Approximate serialized bytes kept in memory (0 = unbounded)."""
+    return _env_int("STUDYFLOW_CACHE_MAX_BYTES", 0)
+
+
+def get_spill_dir() -> str:
+    """Directory for users evicted from the bounded in-memory store."""
+    return os.environ.get("STUDYFLOW_SPILL_DIR") or tempfile.gettempdir()
+
+
+# ---------- Scheduling ----------
+
+def get_schedule_time_budget_ms() -> float:
+    """Time budget for the constraint scheduler's local search, per plan."""
+    return _env_float("STUDYFLOW_SCHEDULE_BUDGET_MS", 20.0)
+
+
+# ---------- LLM ----------
+
+def get_llm_cache_ttl() -> float:
+    """Seconds an LLM response stays cached; 0 disables the cache."""
+    return _env_float("STUDYFLOW_LLM_CACHE_TTL", 3600.0)
+
+
+def get_llm_cache_max_bytes() -> int:
+    """Memory budget of the LLM response cache (response text bytes)."""
+    return _env_int("STUDYFLOW_LLM_CACHE_MAX_BYTES", 8 * 1024 * 1024)
+
+
+def get_llm_cache_dir() -> str:
+    """Directory of the on-disk LLM response cache; empty = memory only."""
+    return os.environ.get("STUDYFLOW_LLM_CACHE_DIR", "")
+
+
+def get_llm_timeout() -> float:
+    """Hard deadline per Gemini call (seconds); the fallback text is used past it."""
+    return _env_float("STUDYFLOW_LLM_TIMEOUT", 8.0)
+
+
+def get_llm_slow_call_seconds() -> float:
+    """Calls slower than this count as failures for the circuit breaker; 0 = off."""
+    return _env_float("STUDYFLOW_LLM_SLOW_SECONDS", 5.0)
+
+
+def get_llm_breaker_failures() -> int:
+    """Consecutive failed or slow calls that open the circuit breaker."""
+    return _env_int("STUDYFLOW_LLM_BREAKER_FAILURES", 5)
+
+
+def get_llm_breaker_cooldown() -> float:
+    """Seconds the breaker stays open before a probe call is let through."""
+    return _env_float("STUDYFLOW_LLM_BREAKER_COOLDOWN", 30.0)
+
+
+def get_llm_prompt_token_budget() -> int:
+    """Estimated tokens a prompt may use; inputs are trimmed to fit. 0 = no limit."""
+    return _env_int("STUDYFLOW_LLM_PROMPT_TOKEN_BUDGET", 2000)
+
+
+def get_llm_max_output_tokens() -> int:
+    """
+    Cap on LLM response tokens. 0 = no cap (the model's default). On
+    thinking models the cap includes thinking tokens, so a low one can
+    leave no text at all.
+    """
+    return _env_int("STUDYFLOW_LLM_MAX_OUTPUT_TOKENS", 0)
+
+
+# ---------- Background feedback ----------
+
+def get_feedback_queue_depth() -> int:
+    """Deferred feedback jobs allowed to wait; beyond it /reflect answers 429."""
+    return _env_int("STUDYFLOW_FEEDBACK_QUEUE_DEPTH", 100)
+
+
+def get_feedback_workers() -> int:
+    """Worker threads generating deferred reflection feedback."""
+    return _env_int("STUDYFLOW_FEEDBACK_WORKERS", 4)
+
+
+def get_feedback_job_ttl() -> float:
+    """Seconds a finished feedback job can still be fetched."""
+    return _env_float("STUDYFLOW_FEEDBACK_JOB_TTL", 600.0)
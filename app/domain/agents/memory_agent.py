@@ -1,9 +1,27 @@
 # app/agents/memory_agent.py
 
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Optional
 
-from app.domain.memory.store import get_user_state, save_user_state
+from app.domain.memory import journal
+from app.domain.memory.records import (
+    Course,
+    HistoryEntry,
+    Task,
+    TaskIndex,
+    TaskStatus,
+    date_to_ordinal,
+)
+from app.domain.memory.store import journaled, transaction
+from app.domain.tools.scheduling_tool import diff_blocks, merge_diffs
+from app.domain.tools.summary_compaction_tool import history_summary, summary_view
+
+# A partially done task keeps at least this much remaining effort, so it is
+# planned again even when the reported minutes overshoot the estimate.
+PARTIAL_FLOOR_MINUTES = 15
+# Plan changes kept per stored plan for /plan_diff; older clients get the
+# full plan instead.
+MAX_PLAN_CHANGES = 20
 
 
 class MemoryAgent:
@@ -14,6 +32,15 @@ class MemoryAgent:
     - profile/preferences
     - history (reflections)
     - session info
+
+    Courses, tasks and history entries are kept as compact records
+    (see `app.domain.memory.records`); callers at the API edge turn them
+    into dicts.
+
+    Every read-modify-write goes through `store.transaction`, so
+    concurrent requests for the same user cannot lose updates. Frequent
+    small updates (reflections, sessions) are journaled instead of
+    rewriting the whole state.
     """
 
     def setup_user(
@@ -24,39 +51,29 @@ class MemoryAgent:
         profile_overrides: Dict[str, Any] | None = None,
     ) -> Dict[str, Any]:
 
-        state = get_user_state(user_id)
+        with transaction(user_id) as state:
+            # Save courses
+            state["courses"] = [Course.from_dict(c) for c in courses]
 
-        # Save courses
-        state["courses"] = courses
+            # Normalize tasks (missing status -> pending)
+            state["tasks"] = TaskIndex(Task.from_dict(t) for t in tasks)
 
-        # Normalize tasks
-        normalized = []
-        for t in tasks:
-            task = dict(t)
-            if "status" not in task:
-                task["status"] = "pending"
-            normalized.append(task)
-        state["tasks"] = normalized
+            # Update profile
+            if profile_overrides:
+                state["profile"].update(profile_overrides)
 
-        # Update profile
-        if profile_overrides:
-            state["profile"].update(profile_overrides)
+            # Stored plans refer to the old tasks
+            state["plans"] = {}
 
-        save_user_state(user_id, state)
-        return self.get_profile_summary(user_id)
+            return self.get_profile_summary(user_id)
 
     def get_profile_summary(self, user_id: str) -> Dict[str, Any]:
 
-        state = get_user_state(user_id)
-        profile = state["profile"]
-        courses = state["courses"]
-        tasks = state["tasks"]
-
-        summary_text = (
-            f"User is enrolled in {len(courses)} courses and has {len(tasks)} tasks. "
-            f"Typical study pattern: up to {profile['max_blocks_per_day']} blocks of "
-            f"{profile['preferred_block_minutes']} minutes per day."
-        )
+        with transaction(user_id, readonly=True) as state:
+            profile = dict(state["profile"])
+            courses = list(state["courses"])
+            tasks = list(state["tasks"])
+            summary_text = self._summary_text(state)
 
         return {
             "profile": profile,
@@ -65,9 +82,65 @@ class MemoryAgent:
             "summary_text": summary_text,
         }
 
-    def get_tasks_for_planning(self, user_id: str) -> List[Dict[str, Any]]:
-        state = get_user_state(user_id)
-        return [t for t in state["tasks"] if t.get("status") != "done"]
+    def get_profile(self, user_id: str) -> Dict[str, Any]:
+        """A copy of the user's profile/preferences."""
+        with transaction(user_id, readonly=True) as state:
+            return dict(state["profile"])
+
+    def get_summary_text(self, user_id: str) -> str:
+        """The profile summary sentence alone, without copying any lists."""
+        with transaction(user_id, readonly=True) as state:
+            return self._summary_text(state)
+
+    @staticmethod
+    def _summary_text(state: Dict[str, Any]) -> str:
+        profile = state["profile"]
+        return (
+            f"User is enrolled in {len(state['courses'])} courses and has {len(state['tasks'])} tasks. "
+            f"Typical study pattern: up to {profile['max_blocks_per_day']} blocks of "
+            f"{profile['preferred_block_minutes']} minutes per day."
+        )
+
+    def get_tasks_for_planning(self, user_id: str, limit: int | None = None) -> List[Task]:
+        """
+        Open (not done) tasks, earliest deadline first. With `limit`, the
+        candidate pool instead: the most urgent `limit` tasks plus every
+        in-progress task and the most urgent tasks of each course (see
+        TaskIndex.planning_candidates), without scanning the backlog.
+        """
+        with transaction(user_id, readonly=True) as state:
+            tasks = state["tasks"]
+            return tasks.open_by_deadline() if limit is None else tasks.planning_candidates(limit)
+
+    def get_recent_history(self, user_id: str, limit: int) -> List[HistoryEntry]:
+        """
+        The last `limit` history entries, oldest first (at most
+        RECENT_HISTORY_ENTRIES are kept raw, see summary_compaction_tool).
+        """
+        with transaction(user_id, readonly=True) as state:
+            return state["history"][-limit:] if limit > 0 else []
+
+    def get_tasks(self, user_id: str, task_ids: Iterable[str]) -> Dict[str, Task]:
+        """Look up the given task ids (unknown ids are skipped)."""
+        with transaction(user_id, readonly=True) as state:
+            tasks = state["tasks"]
+            found = {}
+            for tid in task_ids:
+                task = tasks.get(tid)
+                if task is not None:
+                    found[tid] = task
+            return found
+
+    def get_task_courses(self, user_id: str, task_ids: Iterable[str]) -> Dict[str, str]:
+        """Map the given task ids to their course ids (unknown ids are skipped)."""
+        with transaction(user_id, readonly=True) as state:
+            tasks = state["tasks"]
+            courses = {}
+            for tid in task_ids:
+                task = tasks.get(tid)
+                if task is not None:
+                    courses[tid] = task.course_id
+            return courses
 
     def update_tasks_and_history(
         self,
@@ -77,63 +150,168 @@ class MemoryAgent:
         difficulty_rating: int,
         notes: str,
         date_str: str,
-    ) -> Dict[str, Any]:
+        minutes_spent: Dict[str, int] | None = None,
+    ) -> HistoryEntry:
+        """
+        Record a reflection. Remaining effort is updated incrementally:
+        completed tasks drop to 0, partial ones lose the minutes reported
+        in `minutes_spent` (default: one preferred block).
+        """
+        minutes_spent = minutes_spent or {}
 
-        state = get_user_state(user_id)
-
-        # Update tasks
-        for task in state["tasks"]:
-            tid = task["task_id"]
-            if tid in completed_task_ids:
-                task["status"] = "done"
-            elif tid in partial_task_ids:
-                task["status"] = "in_progress"
-
-        # Append history
-        entry = {
-            "date": date_str,
-            "completed_task_ids": completed_task_ids,
-            "partial_task_ids": partial_task_ids,
-            "difficulty_rating": difficulty_rating,
-            "notes": notes,
-        }
-        state["history"].append(entry)
+        with journaled(user_id) as txn:
+            # Update tasks via the id index; "completed" wins over "partial"
+            tasks = txn.state["tasks"]
+            completed = dict.fromkeys(completed_task_ids)
+            updates = [(tid, TaskStatus.DONE) for tid in completed]
+            updates += [
+                (tid, TaskStatus.IN_PROGRESS)
+                for tid in dict.fromkeys(partial_task_ids)
+                if tid not in completed
+            ]
+            for tid, new_status in updates:
+                task = tasks.get(tid)
+                if task is None:
+                    continue
+                if task.status is not new_status:
+                    txn.append(journal.task_status_changed(tid, new_status))
+                remaining = self._remaining_after(
+                    task, new_status, minutes_spent.get(tid, txn.state["profile"]["preferred_block_minutes"])
+                )
+                if remaining != task.remaining_minutes:
+                    txn.append(journal.task_effort_updated(tid, remaining))
+
+            # Append history
+            entry = HistoryEntry(
+                date=date_to_ordinal(date_str),
+                completed_task_ids=tuple(completed_task_ids),
+                partial_task_ids=tuple(partial_task_ids),
+                difficulty_rating=difficulty_rating,
+                notes=notes,
+            )
+            txn.append(journal.history_appended(entry))
+            return txn.state["history"][-1]
 
-        save_user_state(user_id, state)
-        return entry
+    @staticmethod
+    def _remaining_after(task: Task, status: TaskStatus, spent: int) -> int:
+        if status is TaskStatus.DONE:
+            return 0
+        # Unestimated tasks have no effort to track
+        if task.remaining_minutes <= 0:
+            return task.remaining_minutes
+        floor = min(PARTIAL_FLOOR_MINUTES, task.remaining_minutes)
+        return max(task.remaining_minutes - spent, floor)
 
     def get_status(self, user_id: str) -> Dict[str, Any]:
-        state = get_user_state(user_id)
-        tasks = state["tasks"]
-        total = len(tasks)
-        done = sum(1 for t in tasks if t["status"] == "done")
+        with transaction(user_id, readonly=True) as state:
+            # O(1): counts are maintained by TaskIndex on every change
+            tasks = state["tasks"]
+            total = len(tasks)
+            done = tasks.count(TaskStatus.DONE)
+            summary = history_summary(state)
 
-        return {
-            "total_tasks": total,
-            "completed_tasks": done,
-            "completion_rate": done / total if total else 0.0,
-            "profile": state["profile"],
-            "history_count": len(state["history"]),
-        }
+            return {
+                "total_tasks": total,
+                "completed_tasks": done,
+                "completion_rate": done / total if total else 0.0,
+                "status_counts": tasks.status_counts(),
+                "remaining_minutes": tasks.open_minutes(),
+                "profile": dict(state["profile"]),
+                # Constant size however long the user has been active
+                "history_count": summary["entries"],
+                "history_summary": summary_view(summary),
+            }
+
+    # ------------ PLAN METHODS ----------------
+
+    def save_plan(
+        self,
+        user_id: str,
+        date_str: str,
+        blocks: List[Dict[str, Any]],
+        plan_summary_text: str,
+        precomputed: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Store the plan for a date as a new version. Each version after the
+        first records what changed, so clients can fetch diffs.
+        `precomputed` is the plan key of a plan made by the nightly job.
+        """
+        with journaled(user_id) as txn:
+            old = txn.state.get("plans", {}).get(date_str)
+            if old is None:
+                version, changes = 1, []
+            else:
+                version = old["version"] + 1
+                change = {"version": version, **diff_blocks(old["blocks"], blocks)}
+                changes = (old["changes"] + [change])[-MAX_PLAN_CHANGES:]
+
+            plan = {
+                "date": date_str,
+                "version": version,
+                "blocks": blocks,
+                "plan_summary_text": plan_summary_text,
+                "changes": changes,
+                "precomputed": precomputed,
+            }
+            txn.append(journal.plan_saved(date_str, plan))
+            return plan
+
+    def get_plan(self, user_id: str, date_str: str) -> Optional[Dict[str, Any]]:
+        """The stored plan for a date, or None."""
+        with transaction(user_id, readonly=True) as state:
+            plan = state.get("plans", {}).get(date_str)
+            return dict(plan) if plan is not None else None
+
+    def get_precomputed_dates(self, user_id: str, after: str) -> List[str]:
+        """Dates after `after` with a stored precomputed plan, in order."""
+        with transaction(user_id, readonly=True) as state:
+            return sorted(
+                day
+                for day, plan in state.get("plans", {}).items()
+                if day > after and plan.get("precomputed") is not None
+            )
+
+    def get_plan_diff(self, user_id: str, date_str: str, since_version: int) -> Optional[Dict[str, Any]]:
+        """
+        What changed in a date's plan after `since_version`. When the
+        changes are no longer kept (or since_version is 0) the full plan
+        is returned with "full": True.
+        """
+        plan = self.get_plan(user_id, date_str)
+        if plan is None:
+            return None
+
+        result = {"date": date_str, "version": plan["version"], "full": False}
+        if since_version >= plan["version"]:
+            return {**result, "removed": [], "added": []}
+
+        changes = [c for c in plan["changes"] if c["version"] > since_version]
+        if since_version < 1 or not changes or changes[0]["version"] != since_version + 1:
+            return {**result, "full": True, "blocks": plan["blocks"]}
+        return {**result, **merge_diffs(changes)}
 
     # ------------ SESSION METHODS ----------------
 
     def start_or_continue_session(self, user_id: str, session_id: str | None = None) -> Dict[str, Any]:
-        state = get_user_state(user_id)
-        session = state.get("session", {})
         now = datetime.utcnow().isoformat(timespec="seconds")
 
         if session_id is None:
             session_id = f"session-{now}"
 
-        session["current_session_id"] = session_id
-        session["last_interaction_at"] = now
-        session["interaction_count"] = session.get("interaction_count", 0) + 1
-
-        state["session"] = session
-        save_user_state(user_id, state)
-        return session
+        with journaled(user_id) as txn:
+            session = txn.state.get("session", {})
+            txn.append(
+                journal.session_updated(
+                    {
+                        "current_session_id": session_id,
+                        "last_interaction_at": now,
+                        "interaction_count": session.get("interaction_count", 0) + 1,
+                    }
+                )
+            )
+            return dict(txn.state["session"])
 
     def get_session_info(self, user_id: str) -> Dict[str, Any]:
-        state = get_user_state(user_id)
-        return state.get("session", {})
+        with transaction(user_id, readonly=True) as state:
+            return dict(state.get("session", {}))
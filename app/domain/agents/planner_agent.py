@@ -1,10 +1,94 @@
 # app/domain/agents/planner_agent.py
 
-from typing import Any, Dict, List
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from app.domain.agents.memory_agent import MemoryAgent
-from app.domain.tools.scheduling_tool import schedule_day
-from app.llm.tools import generate_plan_summary
+from app.domain.memory.records import Task, TaskStatus, date_to_ordinal
+from app.domain.memory.store import user_lock
+from app.domain.tools.priority_tool import (
+    history_signals,
+    priority_label,
+    score_tasks,
+    top_k,
+)
+from app.config.settings import get_schedule_time_budget_ms
+from app.domain.tools.scheduling_tool import (
+    Interval,
+    ScheduleQuality,
+    batch_block_counts,
+    batch_normalize,
+    extract_blocks,
+    range_timeline,
+    refill_block,
+    schedule_constrained,
+    schedule_range,
+    study_block,
+    subtract,
+    window_bounds,
+    windows_to_intervals,
+)
+from app.llm.tools import (
+    generate_plan_range_summary,
+    generate_plan_range_summary_async,
+    generate_plan_summary,
+    generate_plan_summary_async,
+    stream_plan_summary,
+)
+
+# Scoring looks at the most urgent CANDIDATES_PER_BLOCK tasks per free
+# block (at least MIN_CANDIDATES), so planning cost stays independent of
+# the backlog size; HISTORY_WINDOW recent reflections feed the scores.
+CANDIDATES_PER_BLOCK = 8
+MIN_CANDIDATES = 32
+HISTORY_WINDOW = 20
+
+
+def plan_key(free: List[Interval], profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    What a day plan depends on besides the tasks: the free time and the
+    profile's block and spacing settings. A precomputed plan is served only
+    when the request produces the same key. (Lists, to compare equal after
+    storage.)
+    """
+    return {
+        "free": [list(interval) for interval in free],
+        "block_minutes": profile.get("preferred_block_minutes", 45),
+        "max_blocks_per_day": profile.get("max_blocks_per_day", 3),
+        **spacing(profile),
+    }
+
+
+def spacing(profile: Dict[str, Any]) -> Dict[str, int]:
+    """The profile's gap / break settings, as scheduler keyword arguments."""
+    return {
+        "gap_minutes": profile.get("gap_minutes") or 0,
+        "break_every": profile.get("break_every") or 0,
+        "break_minutes": profile.get("break_minutes") or 0,
+    }
+
+
+def build_day_plan(snapshot: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], ScheduleQuality]:
+    """
+    Blocks for a day from a `PlannerAgent.snapshot_day` snapshot. Reads
+    nothing from the store, so it can run in a worker process.
+    """
+    key = snapshot["plan_key"]
+    ranked = snapshot["ranked"]
+    placements, quality = schedule_constrained(
+        ranked,
+        [tuple(interval) for interval in key["free"]],
+        preferred_block_minutes=key["block_minutes"],
+        max_blocks_per_day=key["max_blocks_per_day"],
+        time_budget_ms=snapshot["time_budget_ms"],
+        **spacing(key),
+    )
+    scores = {task.task_id: score for task, score in ranked}
+    blocks = [
+        study_block(task, snapshot["date"], block, priority_label(scores[task.task_id]))
+        for task, block in placements
+    ]
+    return blocks, quality
 
 
 class PlannerAgent:
@@ -20,20 +104,391 @@ class PlannerAgent:
         user_id: str,
         date_str: str,
         available_windows: List[Dict[str, str]],
+        busy_windows: Optional[List[Dict[str, str]]] = None,
     ) -> Dict[str, Any]:
-        # Get profile summary and tasks from memory
-        profile_summary = self.memory_agent.get_profile_summary(user_id)
-        tasks = self.memory_agent.get_tasks_for_planning(user_id)
-
-        # Use scheduling tool to create concrete blocks
-        blocks = schedule_day(tasks, date_str, available_windows)
+        served, snapshot, blocks, quality = self._prepare_day(
+            user_id, date_str, available_windows, busy_windows
+        )
+        if served is not None:
+            return served
 
         # LLM summary of the plan
-        summary_text = profile_summary["summary_text"]
-        plan_summary = generate_plan_summary(summary_text, blocks)
+        plan_summary = generate_plan_summary(snapshot["profile_summary"], blocks, user_id)
+        return self._save_day(user_id, date_str, snapshot, blocks, quality, plan_summary)
+
+    async def plan_day_async(
+        self,
+        user_id: str,
+        date_str: str,
+        available_windows: List[Dict[str, str]],
+        busy_windows: Optional[List[Dict[str, str]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        `plan_day` for async callers: store access and scheduling run on a
+        worker thread, only the LLM round trip is awaited on the event loop.
+        """
+        served, snapshot, blocks, quality = await asyncio.to_thread(
+            self._prepare_day, user_id, date_str, available_windows, busy_windows
+        )
+        if served is not None:
+            return served
+
+        plan_summary = await generate_plan_summary_async(snapshot["profile_summary"], blocks, user_id)
+        return await asyncio.to_thread(
+            self._save_day, user_id, date_str, snapshot, blocks, quality, plan_summary
+        )
+
+    async def plan_day_stream(
+        self,
+        user_id: str,
+        date_str: str,
+        available_windows: List[Dict[str, str]],
+        busy_windows: Optional[List[Dict[str, str]]] = None,
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        `plan_day` as a stream of (event, data) pairs: "plan" with the
+        blocks as soon as they are scheduled, "summary" for each piece of
+        LLM text, then "done" with the stored plan's version. The plan is
+        stored once the summary is complete.
+        """
+        served, snapshot, blocks, quality = await asyncio.to_thread(
+            self._prepare_day, user_id, date_str, available_windows, busy_windows
+        )
+        if served is not None:
+            summary = served.pop("plan_summary_text")
+            version = served.pop("plan_version")
+            yield "plan", served
+            yield "summary", {"text": summary}
+            yield "done", {"plan_version": version}
+            return
+
+        yield "plan", {
+            "profile_summary": snapshot["profile_summary"],
+            "planned_blocks": blocks,
+            "precomputed": False,
+            "schedule_quality": quality,
+        }
+
+        parts = []
+        async for text in stream_plan_summary(snapshot["profile_summary"], blocks, user_id):
+            parts.append(text)
+            yield "summary", {"text": text}
+
+        stored = await asyncio.to_thread(
+            self._save_day, user_id, date_str, snapshot, blocks, quality, "".join(parts).strip()
+        )
+        yield "done", {"plan_version": stored["plan_version"]}
+
+    def _prepare_day(
+        self,
+        user_id: str,
+        date_str: str,
+        available_windows: List[Dict[str, str]],
+        busy_windows: Optional[List[Dict[str, str]]],
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]], List[Dict[str, Any]], Optional[ScheduleQuality]]:
+        """
+        Everything before the LLM call. Returns (served, snapshot, blocks,
+        quality); `served` is the full response when a precomputed plan
+        matches, and the rest is then empty.
+        """
+        # Free time first (windows minus busy time)
+        profile = self.memory_agent.get_profile(user_id)
+        free = windows_to_intervals(available_windows)
+        if busy_windows:
+            free = subtract(free, windows_to_intervals(busy_windows))
+        key = plan_key(free, profile)
+
+        # Serve the nightly precomputed plan when the request matches it
+        stored = self.memory_agent.get_plan(user_id, date_str)
+        if stored is not None and stored.get("precomputed") == key:
+            served = {
+                "profile_summary": self.memory_agent.get_summary_text(user_id),
+                "planned_blocks": stored["blocks"],
+                "plan_summary_text": stored["plan_summary_text"],
+                "plan_version": stored["version"],
+                "precomputed": True,
+            }
+            return served, None, [], None
+
+        # Score the candidates and let the constraint scheduler pick
+        snapshot = self.snapshot_day(user_id, date_str, key)
+        blocks, quality = build_day_plan(snapshot)
+        return None, snapshot, blocks, quality
+
+    def _save_day(
+        self,
+        user_id: str,
+        date_str: str,
+        snapshot: Dict[str, Any],
+        blocks: List[Dict[str, Any]],
+        quality: ScheduleQuality,
+        plan_summary: str,
+    ) -> Dict[str, Any]:
+        # Keep the plan so reflections can patch it instead of replanning
+        stored = self.memory_agent.save_plan(user_id, date_str, blocks, plan_summary)
 
+        return {
+            "profile_summary": snapshot["profile_summary"],
+            "planned_blocks": blocks,
+            "plan_summary_text": plan_summary,
+            "plan_version": stored["version"],
+            "precomputed": False,
+            "schedule_quality": quality,
+        }
+
+    def snapshot_day(
+        self,
+        user_id: str,
+        date_str: str,
+        key: Dict[str, Any],
+        slots: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Everything `build_day_plan` needs from memory, as plain picklable
+        data: the summary text and the scored candidates for the free time
+        in `key` (see `plan_key`). `slots` is the number of profile-sized
+        blocks in that time, if the caller already counted them.
+        """
+        # The number of profile-sized blocks bounds the candidate pool
+        if slots is None:
+            free = [tuple(interval) for interval in key["free"]]
+            slots = len(extract_blocks(free, key["block_minutes"], limit=key["max_blocks_per_day"], **spacing(key)))
+        pool = max(MIN_CANDIDATES, CANDIDATES_PER_BLOCK * slots)
+        candidates = self.memory_agent.get_tasks_for_planning(user_id, limit=pool)
+
+        return {
+            "user_id": user_id,
+            "date": date_str,
+            "plan_key": key,
+            "profile_summary": self.memory_agent.get_summary_text(user_id),
+            # Score all candidates; the constraint scheduler picks among them
+            "ranked": self._rank(user_id, candidates, date_str, len(candidates)),
+            "time_budget_ms": get_schedule_time_budget_ms(),
+        }
+
+    def precompute_snapshot(self, user_id: str, date_str: str) -> Dict[str, Any] | None:
+        """
+        Snapshot for the nightly precompute job, planned over the profile's
+        default_windows; None if the profile has none.
+        """
+        profile = self.memory_agent.get_profile(user_id)
+        windows = profile.get("default_windows")
+        if not windows:
+            return None
+        return self.snapshot_day(user_id, date_str, plan_key(windows_to_intervals(windows), profile))
+
+    def precompute_snapshots(
+        self, user_ids: List[str], date_str: str
+    ) -> Tuple[Dict[str, Dict[str, Any] | None], Dict[str, Exception]]:
+        """
+        `precompute_snapshot` for many users. Merging their default_windows
+        and counting the blocks that size each candidate pool run in one
+        NumPy pass; candidates and scores are still read per user.
+        Returns (snapshots, errors): a user whose snapshot failed is only
+        in `errors`.
+        """
+        snapshots: Dict[str, Dict[str, Any] | None] = {}
+        errors: Dict[str, Exception] = {}
+        batch: List[Tuple[str, Dict[str, Any], List[Interval]]] = []
+        for user_id in user_ids:
+            try:
+                profile = self.memory_agent.get_profile(user_id)
+                windows = profile.get("default_windows")
+                if not windows:
+                    snapshots[user_id] = None
+                    continue
+                batch.append((user_id, profile, window_bounds(windows)))
+            except Exception as e:
+                errors[user_id] = e
+
+        frees = batch_normalize([bounds for _, _, bounds in batch])
+        keys = [plan_key(free, profile) for (_, profile, _), free in zip(batch, frees)]
+        slots = batch_block_counts(
+            frees,
+            [key["block_minutes"] for key in keys],
+            [key["max_blocks_per_day"] for key in keys],
+            [key["gap_minutes"] for key in keys],
+            [key["break_every"] for key in keys],
+            [key["break_minutes"] for key in keys],
+        )
+        for (user_id, _, _), key, count in zip(batch, keys, slots):
+            try:
+                snapshots[user_id] = self.snapshot_day(user_id, date_str, key, slots=count)
+            except Exception as e:
+                errors[user_id] = e
+        return snapshots, errors
+
+    def schedule_many(
+        self, user_ids: List[str], date_str: str
+    ) -> Dict[str, Tuple[List[Dict[str, Any]], ScheduleQuality]]:
+        """
+        Blocks for `date_str` over the default_windows of many users, by
+        `build_day_plan` per user (the same scheduler and rules as
+        /plan_day) on batched snapshots. No LLM call and nothing is stored;
+        users without default_windows or whose snapshot failed are left out.
+        """
+        snapshots, _ = self.precompute_snapshots(user_ids, date_str)
+        return {
+            user_id: build_day_plan(snapshot)
+            for user_id, snapshot in snapshots.items()
+            if snapshot is not None
+        }
+
+    def patch_plan(self, user_id: str, date_str: str) -> Dict[str, Any] | None:
+        """
+        Incrementally update the stored plan for `date_str` after task
+        changes: blocks of completed (or removed) tasks are freed and
+        refilled, in the same time slots, with the best open tasks not
+        already in the plan. Other blocks are left as they are and no LLM
+        call is made. Returns the diff, or None if no plan is stored.
+        """
+        # Hold the user's lock so a concurrent plan_day cannot interleave
+        with user_lock(user_id):
+            plan = self.memory_agent.get_plan(user_id, date_str)
+            if plan is None:
+                return None
+
+            # 1. Free blocks whose task is done or gone
+            tasks = self.memory_agent.get_tasks(user_id, {b["task_id"] for b in plan["blocks"]})
+            kept, freed = [], []
+            for block in plan["blocks"]:
+                task = tasks.get(block["task_id"])
+                if task is None or task.status is TaskStatus.DONE:
+                    freed.append(block)
+                else:
+                    kept.append(block)
+
+            if not freed:
+                return {"date": date_str, "version": plan["version"], "removed": [], "added": []}
+
+            # 2. Refill from the deadline index, best scores first
+            planned_ids = {b["task_id"] for b in kept}
+            pool = max(MIN_CANDIDATES, CANDIDATES_PER_BLOCK * len(freed)) + len(planned_ids)
+            candidates = [
+                task
+                for task in self.memory_agent.get_tasks_for_planning(user_id, limit=pool)
+                if task.task_id not in planned_ids
+            ]
+            ranked = self._rank(user_id, candidates, date_str, len(freed))
+            refilled = [
+                refill_block(block, task, priority_label(score))
+                for block, (task, score) in zip(freed, ranked)
+            ]
+
+            # 3. Store as a new version; its change entry is the diff
+            blocks = sorted(kept + refilled, key=lambda b: b["start_time"])
+            stored = self.memory_agent.save_plan(
+                user_id, date_str, blocks, plan["plan_summary_text"], precomputed=plan.get("precomputed")
+            )
+            change = stored["changes"][-1]
+            return {
+                "date": date_str,
+                "version": stored["version"],
+                "removed": change["removed"],
+                "added": change["added"],
+            }
+
+    def patch_precomputed(self, user_id: str, after: str) -> None:
+        """
+        `patch_plan` every precomputed plan for a date after `after`. Their
+        plan key covers free time and settings, not task state, so they
+        would otherwise keep serving blocks of tasks completed since.
+        """
+        for date_str in self.memory_agent.get_precomputed_dates(user_id, after):
+            self.patch_plan(user_id, date_str)
+
+    def plan_range(
+        self,
+        user_id: str,
+        start_date: str,
+        end_date: str,
+        windows_by_day: Dict[str, List[Dict[str, str]]],
+        default_windows: Optional[List[Dict[str, str]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Plan several days at once: one state read, one allocation pass over
+        the merged timeline of all days, one LLM summary.
+        """
+        summary_text, blocks = self._prepare_range(
+            user_id, start_date, end_date, windows_by_day, default_windows
+        )
+        plan_summary = generate_plan_range_summary(summary_text, blocks, start_date, end_date, user_id)
+        return self._range_result(summary_text, start_date, end_date, blocks, plan_summary)
+
+    async def plan_range_async(
+        self,
+        user_id: str,
+        start_date: str,
+        end_date: str,
+        windows_by_day: Dict[str, List[Dict[str, str]]],
+        default_windows: Optional[List[Dict[str, str]]] = None,
+    ) -> Dict[str, Any]:
+        """`plan_range` for async callers (see `plan_day_async`)."""
+        summary_text, blocks = await asyncio.to_thread(
+            self._prepare_range, user_id, start_date, end_date, windows_by_day, default_windows
+        )
+        plan_summary = await generate_plan_range_summary_async(
+            summary_text, blocks, start_date, end_date, user_id
+        )
+        return self._range_result(summary_text, start_date, end_date, blocks, plan_summary)
+
+    def _prepare_range(
+        self,
+        user_id: str,
+        start_date: str,
+        end_date: str,
+        windows_by_day: Dict[str, List[Dict[str, str]]],
+        default_windows: Optional[List[Dict[str, str]]],
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        profile = self.memory_agent.get_profile(user_id)
+        timeline = range_timeline(
+            start_date,
+            end_date,
+            windows_by_day,
+            default_windows,
+            block_minutes=profile.get("preferred_block_minutes", 45),
+            max_blocks_per_day=profile.get("max_blocks_per_day", 3),
+            **spacing(profile),
+        )
+
+        summary_text = self.memory_agent.get_summary_text(user_id)
+        pool = max(MIN_CANDIDATES, CANDIDATES_PER_BLOCK * len(timeline))
+        candidates = self.memory_agent.get_tasks_for_planning(user_id, limit=pool)
+
+        # Score every candidate: the order breaks deadline ties, and the
+        # scores give each block its priority label.
+        ranked = self._rank(user_id, candidates, start_date, len(candidates))
+        blocks = schedule_range(
+            [task for task, _ in ranked],
+            timeline,
+            priorities={task.task_id: priority_label(score) for task, score in ranked},
+        )
+        return summary_text, blocks
+
+    @staticmethod
+    def _range_result(
+        summary_text: str,
+        start_date: str,
+        end_date: str,
+        blocks: List[Dict[str, Any]],
+        plan_summary: str,
+    ) -> Dict[str, Any]:
         return {
             "profile_summary": summary_text,
+            "start_date": start_date,
+            "end_date": end_date,
             "planned_blocks": blocks,
             "plan_summary_text": plan_summary,
         }
+
+    def _rank(
+        self, user_id: str, candidates: List[Task], date_str: str, k: int
+    ) -> List[Tuple[Task, float]]:
+        """Top-k (task, score) pairs from the priority engine."""
+        if not candidates or k <= 0:
+            return []
+        history = self.memory_agent.get_recent_history(user_id, HISTORY_WINDOW)
+        seen_ids = {tid for h in history for tid in (*h.completed_task_ids, *h.partial_task_ids)}
+        signals = history_signals(history, self.memory_agent.get_task_courses(user_id, seen_ids))
+        scores = score_tasks(candidates, date_to_ordinal(date_str), signals)
+        return top_k(candidates, scores, k)
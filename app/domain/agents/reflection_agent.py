@@ -4,7 +4,8 @@ from datetime import datetime
 from typing import Any, Dict, List
 
 from app.domain.agents.memory_agent import MemoryAgent
-from app.domain.memory.store import get_user_state, save_user_state
+from app.domain.memory import journal
+from app.domain.memory.store import journaled
 
 
 class ReflectionAgent:
@@ -25,39 +26,43 @@ class ReflectionAgent:
         difficulty_rating: int,
         notes: str,
         date_str: str | None = None,
+        minutes_spent: Dict[str, int] | None = None,
     ) -> Dict[str, Any]:
         if date_str is None:
             date_str = datetime.today().strftime("%Y-%m-%d")
 
-        # 1. Update tasks and history via MemoryAgent
-        history_entry = self.memory_agent.update_tasks_and_history(
-            user_id=user_id,
-            completed_task_ids=completed_task_ids,
-            partial_task_ids=partial_task_ids,
-            difficulty_rating=difficulty_rating,
-            notes=notes,
-            date_str=date_str,
-        )
+        # One transaction for the task/history update and the profile
+        # adaptation, so a concurrent reflection cannot interleave.
+        with journaled(user_id) as txn:
+            # 1. Update tasks and history via MemoryAgent
+            history_entry = self.memory_agent.update_tasks_and_history(
+                user_id=user_id,
+                completed_task_ids=completed_task_ids,
+                partial_task_ids=partial_task_ids,
+                difficulty_rating=difficulty_rating,
+                notes=notes,
+                date_str=date_str,
+                minutes_spent=minutes_spent,
+            )
 
-        # 2. Simple adaptation rule for profile:
-        #    - if user struggled (rating >= 4 and some partial tasks) -> reduce max_blocks_per_day
-        #    - if user found it easy (rating <= 2 and all tasks done) -> increase max_blocks_per_day (up to 5)
-        state = get_user_state(user_id)
-        profile = state["profile"]
-        max_blocks = profile.get("max_blocks_per_day", 3)
+            # 2. Simple adaptation rule for profile:
+            #    - if user struggled (rating >= 4 and some partial tasks) -> reduce max_blocks_per_day
+            #    - if user found it easy (rating <= 2 and all tasks done) -> increase max_blocks_per_day (up to 5)
+            profile = txn.state["profile"]
+            max_blocks = profile.get("max_blocks_per_day", 3)
 
-        if difficulty_rating >= 4 and len(partial_task_ids) > 0:
-            max_blocks = max(1, max_blocks - 1)
-        elif (
-            difficulty_rating <= 2
-            and len(partial_task_ids) == 0
-            and len(completed_task_ids) >= max_blocks
-        ):
-            max_blocks = min(5, max_blocks + 1)
+            if difficulty_rating >= 4 and len(partial_task_ids) > 0:
+                max_blocks = max(1, max_blocks - 1)
+            elif (
+                difficulty_rating <= 2
+                and len(partial_task_ids) == 0
+                and len(completed_task_ids) >= max_blocks
+            ):
+                max_blocks = min(5, max_blocks + 1)
 
-        profile["max_blocks_per_day"] = max_blocks
-        state["profile"] = profile
-        save_user_state(user_id, state)
+            if profile.get("max_blocks_per_day") != max_blocks:
+                txn.append(journal.profile_updated({"max_blocks_per_day": max_blocks}))
+            profile = dict(profile)
 
         return {
             "history_entry": history_entry,
@@ -0,0 +1,225 @@
+# app/domain/feedback_jobs.py
+
+"""
+Background generation of reflection feedback.
+
+A deferred `/reflect` saves the reflection, then hands the LLM feedback to
+this queue and returns a job id right away. A fixed pool of worker
+threads generates the feedback; clients poll for the job or long-poll
+until it is done.
+
+The queue is bounded: when `max_depth` jobs are already waiting,
+`reserve` raises QueueFullError and the route answers 429. A slot is
+reserved before the reflection is saved, so a rejected request changes
+nothing. Finished jobs are kept for `ttl_seconds`.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.llm.tools import generate_reflection_feedback
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+
+class QueueFullError(RuntimeError):
+    """Raised by `reserve` when the queue is at its depth limit."""
+
+
+class FeedbackJobs:
+    """
+    Bounded job queue + worker threads for reflection feedback. Workers
+    start on the first job. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[Dict[str, Any], Dict[str, Any], str], str],
+        max_depth: int = 100,
+        workers: int = 4,
+        ttl_seconds: float = 600.0,
+    ) -> None:
+        self.generate = generate
+        self.max_depth = max(1, max_depth)
+        self.workers = max(1, workers)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._queued = 0                # reserved or waiting, not yet picked up
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0}
+
+    # ---------- Producer side ----------
+
+    def reserve(self, user_id: str) -> str:
+        """
+        Claim a queue slot for `user_id`'s next job and return its id.
+        Raises QueueFullError when `max_depth` jobs are already waiting.
+        """
+        with self._lock:
+            self._prune(time.time())
+            if self._queued >= self.max_depth:
+                self._stats["rejected"] += 1
+                raise QueueFullError(f"Feedback queue is full ({self.max_depth} jobs waiting)")
+            self._queued += 1
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "user_id": user_id,
+                "status": QUEUED,
+                "feedback_text": None,
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+            return job_id
+
+    def submit(self, job_id: str, history_entry: Dict[str, Any], status: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue the reserved job with its inputs; returns the job."""
+        with self._lock:
+            job = self._jobs[job_id]
+            job["_inputs"] = (history_entry, status)
+            self._stats["submitted"] += 1
+            self._start_workers()
+        self._queue.put(job_id)
+        return self._public(job)
+
+    def release(self, job_id: str) -> None:
+        """Give back a reserved slot that will not be submitted."""
+        with self._lock:
+            if self._jobs.pop(job_id, None) is not None:
+                self._queued -= 1
+
+    # ---------- Consumer side ----------
+
+    def get(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job, or None if unknown, expired or not `user_id`'s."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["user_id"] != user_id:
+                return None
+            return self._public(job)
+
+    async def wait(self, user_id: str, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Like `get`, but first waits up to `timeout` seconds for the job to
+        finish. Wakes up as soon as a worker completes it.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["user_id"] != user_id:
+                return None
+            waiter = None
+            if job["status"] != DONE and timeout > 0:
+                waiter = loop.create_future()
+                self._waiters.setdefault(job_id, []).append((loop, waiter))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    waiters = self._waiters.get(job_id, [])
+                    if (loop, waiter) in waiters:
+                        waiters.remove((loop, waiter))
+        return self.get(user_id, job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job["status"] == RUNNING)
+            return {
+                **self._stats,
+                "queued": self._queued,
+                "running": running,
+                "max_depth": self.max_depth,
+                "workers": self.workers,
+            }
+
+    # ---------- Internals ----------
+
+    def _start_workers(self) -> None:
+        # Call with _lock held
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"feedback-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                self._queued -= 1
+                job["status"] = RUNNING
+                history_entry, status = job.pop("_inputs")
+
+            # generate() has its own fallback text; this guards the worker
+            try:
+                text = self.generate(history_entry, status, job["user_id"])
+            except Exception as e:
+                text = f"Feedback could not be generated ({type(e).__name__})."
+
+            with self._lock:
+                job["feedback_text"] = text
+                job["status"] = DONE
+                job["finished_at"] = time.time()
+                self._stats["completed"] += 1
+                waiters = self._waiters.pop(job_id, [])
+            for loop, waiter in waiters:
+                try:
+                    loop.call_soon_threadsafe(_resolve, waiter)
+                except RuntimeError:
+                    # That loop is closed; nobody is waiting any more
+                    pass
+
+    def _prune(self, now: float) -> None:
+        # Call with _lock held
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["status"] == DONE and now - job["finished_at"] > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in job.items() if not k.startswith("_")}
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_JOBS: Optional[FeedbackJobs] = None
+_JOBS_LOCK = threading.Lock()
+
+
+def get_feedback_jobs() -> FeedbackJobs:
+    """The process-wide feedback queue, built from settings on first use."""
+    global _JOBS
+    if _JOBS is None:
+        with _JOBS_LOCK:
+            if _JOBS is None:
+                _JOBS = FeedbackJobs(
+                    generate_reflection_feedback,
+                    max_depth=settings.get_feedback_queue_depth(),
+                    workers=settings.get_feedback_workers(),
+                    ttl_seconds=settings.get_feedback_job_ttl(),
+                )
+    return _JOBS
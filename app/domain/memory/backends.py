@@ -0,0 +1,698 @@
+# app/domain/memory/backends.py
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.common.lru import LRUCache
+from app.domain.memory import journal
+from app.domain.memory.records import decode_state, encode_state
+
+
+def _no_lock(user_id: str) -> threading.Lock:
+    """Default `lock_for`: a fresh lock nobody else holds."""
+    return threading.Lock()
+
+
+class StoreBackend:
+    """
+    Storage backend behind `get_user_state` / `save_user_state`.
+
+    A backend hands out live state dicts: the object returned by `load`
+    is the one agents mutate, and `save` tells the backend it changed.
+    """
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the stored state for `user_id`, or None if unknown."""
+        raise NotImplementedError
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> None:
+        """Record `state` as the current state for `user_id`."""
+        raise NotImplementedError
+
+    def append_events(
+        self, user_id: str, state: Dict[str, Any], events: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Record journal events already applied to `state`. Backends without
+        a journal treat this as a full-state save.
+        """
+        self.save(user_id, state)
+
+    def user_ids(self) -> List[str]:
+        """Return the ids of all stored users."""
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Write any pending changes to durable storage."""
+
+    def close(self) -> None:
+        """Flush and release resources. Called once on shutdown."""
+        self.flush()
+
+
+class InMemoryBackend(StoreBackend):
+    """
+    Plain dict of user states. Nothing survives a restart.
+    For the capstone this is enough, and it stays the default.
+    """
+
+    def __init__(self) -> None:
+        self._states: Dict[str, Dict[str, Any]] = {}
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self._states.get(user_id)
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> None:
+        self._states[user_id] = state
+
+    def user_ids(self) -> List[str]:
+        return list(self._states)
+
+
+class CachingBackend(StoreBackend):
+    """
+    Base for backends that keep hot users in a bounded LRU cache in front
+    of a "cold" on-disk tier.
+
+    Subclasses implement `_read_cold`, `_write_cold` and `_cold_user_ids`.
+    Users are marked dirty on `save`; dirty users are written to the cold
+    tier by `flush` or when they are evicted, clean ones are just dropped.
+    A cold tier shared with other processes can override `_refresh` to
+    replace a cached state that another writer has changed.
+
+    `lock_for(user_id)` returns the lock agents hold while mutating that
+    user. It is taken while serializing a state, so the cold tier never
+    sees a half-applied update. Eviction only try-acquires it: a user whose
+    lock is busy is in use, not cold, and is skipped.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 0,
+        max_bytes: int = 0,
+        lock_for: Optional[Callable[[str], Any]] = None,
+    ) -> None:
+        self._cache: LRUCache[Dict[str, Any]] = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self._dirty: Dict[str, None] = {}
+        self._flushing: Dict[str, None] = {}  # being written by flush()
+        self._lock = threading.Lock()      # guards _cache / _dirty / _flushing
+        self._lock_for = lock_for or _no_lock
+
+    # ---------- Cold tier (subclass hooks) ----------
+
+    def _read_cold(self, user_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def _write_cold(self, rows: List[Tuple[str, str, Any]]) -> None:
+        """Write (user_id, encoded state, pending writes from `_take_pending`) rows."""
+        raise NotImplementedError
+
+    def _cold_user_ids(self) -> List[str]:
+        raise NotImplementedError
+
+    def _recover(self, user_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Finish rebuilding a state read from the cold tier."""
+        return state
+
+    def _refresh(self, user_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        """The state to serve for a cache hit; `state` unless it is outdated."""
+        return state
+
+    def _needs_write(self, user_id: str) -> bool:
+        """True if evicting `user_id` must write its state first."""
+        return user_id in self._dirty
+
+    def _take_pending(self, user_id: str) -> Any:
+        """Take the pending writes of a user whose full state is being written."""
+        self._dirty.pop(user_id, None)
+        return None
+
+    def _restore_pending(self, user_id: str, pending: Any) -> None:
+        """Undo `_take_pending` after a failed write."""
+        self._dirty[user_id] = None
+
+    # ---------- Serialization ----------
+
+    def _encode(self, state: Dict[str, Any]) -> str:
+        return encode_state(state)
+
+    def _decode(self, raw: str) -> Dict[str, Any]:
+        return decode_state(raw)
+
+    # ---------- StoreBackend API ----------
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._cache.get(user_id)
+        if state is not None:
+            return self._refresh(user_id, state)
+
+        raw = self._read_cold(user_id)
+        if raw is None:
+            return None
+
+        loaded = self._recover(user_id, self._decode(raw))
+        with self._lock:
+            # Another thread may have loaded it meanwhile; keep the first copy.
+            state = self._cache.get(user_id)
+            if state is None:
+                state = loaded
+                self._cache.put(user_id, state, size=len(raw))
+        self._evict(keep=user_id)
+        return state
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> None:
+        # Re-measuring costs a serialization, so only pay it for a byte budget.
+        size = len(self._encode(state)) if self._cache.max_bytes else None
+        with self._lock:
+            self._cache.put(user_id, state, size=size)
+            self._dirty[user_id] = None
+        self._evict(keep=user_id)
+
+    def user_ids(self) -> List[str]:
+        ids = set(self._cold_user_ids())
+        with self._lock:
+            ids.update(self._cache.keys())
+        return sorted(ids)
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty = list(self._dirty)
+            self._dirty.clear()
+            self._flushing.update(dict.fromkeys(dirty))
+            batch = [(uid, self._cache.peek(uid)) for uid in dirty]
+
+        rows = []
+        try:
+            for uid, state in batch:
+                if state is None:
+                    continue
+                with self._lock_for(uid):
+                    rows.append((uid, self._encode(state), None))
+            if rows:
+                self._write_cold(rows)
+        except Exception:
+            # Put the users back so the next flush retries them.
+            with self._lock:
+                for uid in dirty:
+                    self._dirty[uid] = None
+            raise
+        finally:
+            with self._lock:
+                for uid in dirty:
+                    self._flushing.pop(uid, None)
+
+    @property
+    def cached_user_count(self) -> int:
+        """Number of users currently held in memory."""
+        return len(self._cache)
+
+    # ---------- Eviction ----------
+
+    def _evict(self, keep: str) -> None:
+        """Spill cold users until the cache is back within budget."""
+        if not self._cache.over_budget():
+            return
+
+        held = []
+        victims = []
+        try:
+            with self._lock:
+                for uid in self._cache.eviction_candidates():
+                    if not self._cache.over_budget():
+                        break
+                    if uid == keep or uid in self._flushing:
+                        continue
+                    user_lock = self._lock_for(uid)
+                    if not user_lock.acquire(blocking=False):
+                        continue
+                    held.append(user_lock)
+                    needs_write = self._needs_write(uid)
+                    state = self._cache.discard(uid)
+                    if needs_write:
+                        victims.append((uid, state, self._take_pending(uid)))
+
+            # Victims stay locked until written, so nobody can fault in a
+            # stale copy from the cold tier in between.
+            if victims:
+                self._write_cold([(uid, self._encode(s), pending) for uid, s, pending in victims])
+        except Exception:
+            with self._lock:
+                for uid, state, pending in victims:
+                    self._cache.put(uid, state)
+                    self._restore_pending(uid, pending)
+            raise
+        finally:
+            for user_lock in held:
+                user_lock.release()
+
+
+class DiskSpillBackend(CachingBackend):
+    """
+    Memory-bounded variant of the in-memory store.
+
+    Hot users live in an LRU cache; users evicted from it are written as
+    one JSON file each under a private spill directory and faulted back in
+    on access. Like InMemoryBackend, nothing survives a restart: the spill
+    directory belongs to this process and is removed on close.
+    """
+
+    def __init__(
+        self,
+        spill_root: str,
+        max_entries: int = 0,
+        max_bytes: int = 0,
+        lock_for: Optional[Callable[[str], Any]] = None,
+    ) -> None:
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, lock_for=lock_for)
+        os.makedirs(spill_root, exist_ok=True)
+        self.spill_dir = tempfile.mkdtemp(prefix="studyflow-spill-", dir=spill_root)
+        self._spilled: Dict[str, str] = {}   # user_id -> file path
+
+    def _path_for(self, user_id: str) -> str:
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.json")
+
+    def _read_cold(self, user_id: str) -> Optional[str]:
+        path = self._spilled.get(user_id)
+        if path is None:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _write_cold(self, rows: List[Tuple[str, str, Any]]) -> None:
+        for uid, raw, _ in rows:
+            path = self._path_for(uid)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(raw)
+            os.replace(tmp, path)
+            self._spilled[uid] = path
+
+    def _cold_user_ids(self) -> List[str]:
+        return list(self._spilled)
+
+    def flush(self) -> None:
+        # Spill files only exist to bound memory; there is nothing to persist.
+        pass
+
+    def close(self) -> None:
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+class SQLiteBackend(CachingBackend):
+    """
+    SQLite (WAL mode) backend with write-behind batching.
+
+    `save` only marks a user dirty. A background thread serializes all
+    dirty users and commits them in one transaction every
+    `flush_interval` seconds (or earlier once `batch_size` users are
+    dirty), so a request never waits on a commit. With WAL and
+    synchronous=NORMAL, commits do not fsync; the WAL is synced at
+    checkpoints. A crash can lose at most the last flush interval.
+
+    Journal events (see `app.domain.memory.journal`) are appended as rows
+    of their own instead of rewriting the user, so a reflection costs O(1)
+    to persist. Once a user has `snapshot_every` events since the last
+    snapshot, the next flush writes a fresh snapshot and deletes the
+    journal rows it covers. Loading a user is snapshot + replayed tail.
+
+    With `max_entries` / `max_bytes` set, only hot users stay in memory;
+    cold ones are written (if dirty) and re-read from the database.
+
+    Several processes may share the database (the server and the nightly
+    precompute job). Each user's snapshot carries a version, and every
+    process remembers the position (version, last journal seq) its cached
+    state was built from. A write compares that position with the
+    database's: if another process wrote the user meanwhile, events are
+    still appended, but a compacting snapshot is skipped, since it would
+    delete the other writer's rows, and the user is reloaded. A cached
+    user is compared with the database at most every `refresh_interval`
+    seconds and rebuilt from it (plus this process's unflushed events)
+    when another writer has changed it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 1.0,
+        batch_size: int = 256,
+        snapshot_every: int = 100,
+        max_entries: int = 0,
+        max_bytes: int = 0,
+        lock_for: Optional[Callable[[str], Any]] = None,
+        refresh_interval: float = 1.0,
+    ) -> None:
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, lock_for=lock_for)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.refresh_interval = refresh_interval
+
+        # Events not yet written, journal length since the last snapshot,
+        # and users due for a compacting snapshot.
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        self._journal_len: Dict[str, int] = {}
+        self._compact: Dict[str, None] = {}
+
+        # Database position (snapshot version, last journal seq) each
+        # cached state reflects, when it was last checked, and journal
+        # tails read by `_read_cold` for `_recover` to replay.
+        self._seen: Dict[str, Tuple[int, int]] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._tails: Dict[str, Tuple[Tuple[int, int], List[Dict[str, Any]]]] = {}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_state ("
+            " user_id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(user_state)")}
+        if "journal_seq" not in columns:
+            self._conn.execute(
+                "ALTER TABLE user_state ADD COLUMN journal_seq INTEGER NOT NULL DEFAULT 0"
+            )
+        if "version" not in columns:
+            self._conn.execute(
+                "ALTER TABLE user_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+            )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id TEXT NOT NULL,"
+            " event TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS journal_user_seq ON journal (user_id, seq)"
+        )
+        self._db_lock = threading.Lock()   # one writer on the connection
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name="sqlite-store-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    # ---------- Cold tier ----------
+
+    def _read_cold(self, user_id: str) -> Optional[str]:
+        stored = self._read_user(user_id)
+        if stored is None:
+            return None
+        raw, position, events = stored
+        with self._lock:
+            self._tails[user_id] = (position, events)
+        return raw
+
+    def _recover(self, user_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            position, events = self._tails.pop(user_id, ((0, 0), []))
+        journal.replay(state, events)
+        with self._lock:
+            self._journal_len[user_id] = len(events)
+            self._seen[user_id] = position
+            self._checked_at[user_id] = time.monotonic()
+        return state
+
+    def _refresh(self, user_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            if (
+                now - self._checked_at.get(user_id, 0.0) < self.refresh_interval
+                # A pending full save replaces the user anyway, and a user
+                # being flushed has events in neither memory nor database
+                or user_id in self._dirty
+                or user_id in self._flushing
+            ):
+                return state
+            self._checked_at[user_id] = now
+            seen = self._seen.get(user_id, (0, 0))
+        with self._db_lock:
+            position = self._position(user_id)
+        if position == seen:
+            return state
+
+        # Another process wrote this user: rebuild it from the database
+        # and replay the events this process has not written yet.
+        raw = self._read_cold(user_id)
+        if raw is None:
+            return state
+        fresh = self._recover(user_id, self._decode(raw))
+        with self._lock:
+            pending = list(self._events.get(user_id, ()))
+        journal.replay(fresh, pending)
+        with self._lock:
+            self._journal_len[user_id] += len(pending)
+            self._cache.put(user_id, fresh, size=len(raw))
+        return fresh
+
+    def _needs_write(self, user_id: str) -> bool:
+        return user_id in self._dirty or user_id in self._compact or user_id in self._events
+
+    def _take_pending(self, user_id: str) -> Tuple[List[Dict[str, Any]], bool]:
+        # Events are written alongside the snapshot; if the snapshot is
+        # skipped for a conflict, they still reach the journal.
+        replace = user_id in self._dirty
+        self._dirty.pop(user_id, None)
+        self._compact.pop(user_id, None)
+        return self._events.pop(user_id, []), replace
+
+    def _restore_pending(self, user_id: str, pending: Tuple[List[Dict[str, Any]], bool]) -> None:
+        events, replace = pending
+        if events:
+            self._events[user_id] = events + self._events.get(user_id, [])
+        if replace:
+            self._dirty[user_id] = None
+        else:
+            self._compact[user_id] = None
+
+    def _write_cold(self, rows: List[Tuple[str, str, Any]]) -> None:
+        batch = []
+        for uid, raw, pending in rows:
+            events, replace = pending if pending is not None else ([], True)
+            batch.append((uid, raw, [json.dumps(e) for e in events], replace))
+        self._commit(batch)
+
+    def _cold_user_ids(self) -> List[str]:
+        with self._db_lock:
+            rows = self._conn.execute("SELECT user_id FROM user_state").fetchall()
+        return [r[0] for r in rows]
+
+    def _position(self, user_id: str) -> Tuple[int, int]:
+        """
+        (snapshot version, last journal seq) of a stored user, (0, 0) if
+        unknown. Any write by any process moves it. Caller holds _db_lock.
+        """
+        row = self._conn.execute(
+            "SELECT version, MAX(journal_seq, ("
+            " SELECT COALESCE(MAX(seq), 0) FROM journal WHERE user_id = ?"
+            ")) FROM user_state WHERE user_id = ?",
+            (user_id, user_id),
+        ).fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    def _read_user(
+        self, user_id: str
+    ) -> Optional[Tuple[str, Tuple[int, int], List[Dict[str, Any]]]]:
+        """
+        (snapshot, position, journal events after it) of a stored user, read
+        in one transaction so another process's compaction cannot fall in
+        between; None if unknown.
+        """
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute(
+                    "SELECT state, version, journal_seq FROM user_state WHERE user_id = ?",
+                    (user_id,),
+                ).fetchone()
+                if row is None:
+                    return None
+                tail = self._conn.execute(
+                    "SELECT seq, event FROM journal WHERE user_id = ? AND seq > ? ORDER BY seq",
+                    (user_id, row[2]),
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        position = (row[1], tail[-1][0] if tail else row[2])
+        return row[0], position, [json.loads(event) for _, event in tail]
+
+    def _commit(self, batch: List[Tuple[str, Optional[str], List[str], bool]]) -> None:
+        """
+        Write one batch in a single transaction. Each item is
+        (user_id, snapshot or None, encoded events, replace); events go in
+        first so a snapshot covers them and can delete their rows.
+
+        If a user's position moved since this process last saw it, another
+        process wrote the user: a compacting snapshot is skipped and the
+        user is reloaded on its next access. A `replace` snapshot (a full
+        save, such as setup) is written anyway; it supersedes the user.
+        """
+        now = time.time()
+        positions: Dict[str, Tuple[int, int]] = {}
+        snapshots = []
+        stale = []
+        with self._db_lock:
+            try:
+                # IMMEDIATE takes the write lock up front, so no other
+                # process can write between the position check and the writes
+                self._conn.execute("BEGIN IMMEDIATE")
+                for uid, raw, events, replace in batch:
+                    version, seq = self._position(uid)
+                    with self._lock:
+                        foreign = (version, seq) != self._seen.get(uid, (0, 0))
+                    if events:
+                        self._conn.executemany(
+                            "INSERT INTO journal (user_id, event, created_at) VALUES (?, ?, ?)",
+                            [(uid, e, now) for e in events],
+                        )
+                        seq = self._conn.execute(
+                            "SELECT MAX(seq) FROM journal WHERE user_id = ?", (uid,)
+                        ).fetchone()[0]
+                    if raw is not None and (replace or not foreign):
+                        version += 1
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO user_state "
+                            "(user_id, state, updated_at, journal_seq, version) VALUES (?, ?, ?, ?, ?)",
+                            (uid, raw, now, seq, version),
+                        )
+                        self._conn.execute(
+                            "DELETE FROM journal WHERE user_id = ? AND seq <= ?", (uid, seq)
+                        )
+                        snapshots.append(uid)
+                    elif foreign:
+                        stale.append(uid)
+                        continue
+                    positions[uid] = (version, seq)
+                self._conn.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+
+        with self._lock:
+            self._seen.update(positions)
+            for uid in snapshots:
+                self._journal_len[uid] = len(self._events.get(uid, ()))
+            for uid in stale:
+                # Compare with the database on the next access
+                self._checked_at.pop(uid, None)
+
+    # ---------- Journal ----------
+
+    def append_events(
+        self, user_id: str, state: Dict[str, Any], events: List[Dict[str, Any]]
+    ) -> None:
+        with self._lock:
+            self._cache.put(user_id, state)
+            self._events.setdefault(user_id, []).extend(events)
+            pending = self._journal_len.get(user_id, 0) + len(events)
+            self._journal_len[user_id] = pending
+            if pending >= self.snapshot_every:
+                self._compact[user_id] = None
+        self._evict(keep=user_id)
+        self._maybe_wake()
+
+    def journal_tail(self, user_id: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Return the user's last persisted snapshot and the journal events
+        written after it, in order. `journal.replay(snapshot, events)`
+        rebuilds the persisted state, which is handy for debugging.
+        """
+        stored = self._read_user(user_id)
+        if stored is None:
+            return None, []
+        raw, _, events = stored
+        return self._decode(raw), events
+
+    # ---------- StoreBackend API ----------
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> None:
+        super().save(user_id, state)
+        self._maybe_wake()
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty = set(self._dirty)
+            compact = set(self._compact)
+            uids = list(dict.fromkeys([*self._dirty, *self._compact, *self._events]))
+            self._dirty.clear()
+            self._compact.clear()
+            self._flushing.update(dict.fromkeys(uids))
+
+        batch = []
+        taken: Dict[str, List[Dict[str, Any]]] = {}
+        try:
+            for uid in uids:
+                # Take events and snapshot under the user's lock so the
+                # snapshot contains exactly the events written before it.
+                with self._lock_for(uid):
+                    with self._lock:
+                        events = self._events.pop(uid, [])
+                        state = self._cache.peek(uid)
+                    taken[uid] = events
+                    snapshot = uid in dirty or uid in compact
+                    raw = self._encode(state) if snapshot and state is not None else None
+                encoded = [json.dumps(e) for e in events]
+                if raw is not None or encoded:
+                    batch.append((uid, raw, encoded, uid in dirty))
+            if batch:
+                self._commit(batch)
+        except Exception:
+            # Put everything back so the next flush retries it.
+            with self._lock:
+                for uid in dirty:
+                    self._dirty[uid] = None
+                for uid in compact:
+                    self._compact[uid] = None
+                for uid, events in taken.items():
+                    if events:
+                        self._events[uid] = events + self._events.get(uid, [])
+            raise
+        finally:
+            with self._lock:
+                for uid in uids:
+                    self._flushing.pop(uid, None)
+
+    def close(self) -> None:
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._flusher.join(timeout=max(1.0, 2 * self.flush_interval))
+        self.flush()
+        with self._db_lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+
+    # ---------- Background flushing ----------
+
+    def _maybe_wake(self) -> None:
+        if len(self._dirty) + len(self._compact) + len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    def _flush_loop(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Keep the thread alive; dirty users are retried next round.
+                pass
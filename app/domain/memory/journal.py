@@ -0,0 +1,105 @@
+# app/domain/memory/journal.py
+
+"""
+Append-only journal of small user-state changes.
+
+Reflections and session updates are recorded as events instead of
+rewriting the whole user state, so their write cost does not grow with
+history size. A backend that persists events (SQLiteBackend) stores them
+after the last snapshot and rebuilds a user as snapshot + replayed tail.
+"""
+
+from typing import Any, Dict, Iterable, List
+
+from app.domain.memory.records import HistoryEntry, TaskStatus, from_stored
+from app.domain.tools.summary_compaction_tool import append_history
+
+HISTORY_APPENDED = "history_appended"
+TASK_STATUS_CHANGED = "task_status_changed"
+TASK_EFFORT_UPDATED = "task_effort_updated"
+PROFILE_UPDATED = "profile_updated"
+SESSION_UPDATED = "session_updated"
+PLAN_SAVED = "plan_saved"
+
+# Stored plans kept per user (latest dates win).
+MAX_STORED_PLANS = 14
+
+
+# ---------- Event constructors ----------
+
+# Events are plain JSON data so they can be written to the journal as-is.
+
+def history_appended(entry: HistoryEntry) -> Dict[str, Any]:
+    return {"type": HISTORY_APPENDED, "entry": entry.to_row()}
+
+
+def task_status_changed(task_id: str, status: TaskStatus) -> Dict[str, Any]:
+    return {"type": TASK_STATUS_CHANGED, "task_id": task_id, "status": status.label}
+
+
+def task_effort_updated(task_id: str, remaining_minutes: int) -> Dict[str, Any]:
+    # Absolute value, not a delta, so replaying an event twice is harmless
+    return {"type": TASK_EFFORT_UPDATED, "task_id": task_id, "remaining_minutes": remaining_minutes}
+
+
+def profile_updated(changes: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": PROFILE_UPDATED, "changes": changes}
+
+
+def session_updated(changes: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": SESSION_UPDATED, "changes": changes}
+
+
+def plan_saved(date_str: str, plan: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": PLAN_SAVED, "date": date_str, "plan": plan}
+
+
+# ---------- Applying / replaying ----------
+
+def apply_event(state: Dict[str, Any], event: Dict[str, Any]) -> None:
+    """Apply one journal event to a user state in place."""
+    kind = event["type"]
+
+    if kind == HISTORY_APPENDED:
+        # Keeps a bounded raw window and folds older entries into a summary
+        append_history(state, from_stored(HistoryEntry, event["entry"]))
+    elif kind == TASK_STATUS_CHANGED:
+        state["tasks"].set_status(event["task_id"], TaskStatus.parse(event["status"]))
+    elif kind == TASK_EFFORT_UPDATED:
+        state["tasks"].set_remaining(event["task_id"], event["remaining_minutes"])
+    elif kind == PROFILE_UPDATED:
+        state["profile"].update(event["changes"])
+    elif kind == SESSION_UPDATED:
+        state.setdefault("session", {}).update(event["changes"])
+    elif kind == PLAN_SAVED:
+        plans = state.setdefault("plans", {})
+        plans[event["date"]] = event["plan"]
+        # ISO dates sort chronologically; drop the oldest beyond the cap
+        for old in sorted(plans)[:-MAX_STORED_PLANS]:
+            del plans[old]
+    else:
+        raise ValueError(f"Unknown journal event type: {kind!r}")
+
+
+def replay(state: Dict[str, Any], events: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply `events` in order to `state` (in place) and return it."""
+    for event in events:
+        apply_event(state, event)
+    return state
+
+
+class JournalTransaction:
+    """
+    Collects the events of one `store.journaled` block.
+
+    `append` applies the event to the live state right away, so reads
+    inside the block see it, and keeps it for the backend to persist.
+    """
+
+    def __init__(self, state: Dict[str, Any]) -> None:
+        self.state = state
+        self.events: List[Dict[str, Any]] = []
+
+    def append(self, event: Dict[str, Any]) -> None:
+        apply_event(self.state, event)
+        self.events.append(event)
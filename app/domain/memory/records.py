@@ -0,0 +1,391 @@
+# app/domain/memory/records.py
+
+"""
+Compact typed records for the per-user state.
+
+Courses, tasks and history entries are slotted dataclasses instead of
+dicts: no per-instance __dict__, task status is a small int enum and dates
+are stored as integer day ordinals (`date.toordinal()`), so planning
+compares ints instead of re-parsing "YYYY-MM-DD" strings.
+
+A user's tasks live in a `TaskIndex`, which keeps a task_id lookup and
+per-status counts next to the list.
+
+Records are converted to plain dicts only at the edges: `to_dict` for API
+responses and prompts, `to_row` / `encode_state` for storage.
+"""
+
+import json
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from datetime import date
+from enum import IntEnum
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+_STATUS_LABELS = ("pending", "in_progress", "done")
+
+
+class TaskStatus(IntEnum):
+    PENDING = 0
+    IN_PROGRESS = 1
+    DONE = 2
+
+    @property
+    def label(self) -> str:
+        """The API spelling: "pending", "in_progress" or "done"."""
+        return _STATUS_LABELS[self]
+
+    @classmethod
+    def parse(cls, value: "str | int | TaskStatus | None") -> "TaskStatus":
+        """Accept an API label, an int, or None (-> PENDING)."""
+        if value is None:
+            return cls.PENDING
+        if isinstance(value, str):
+            try:
+                return cls(_STATUS_LABELS.index(value))
+            except ValueError:
+                raise ValueError(f"Unknown task status: {value!r}")
+        return cls(value)
+
+
+def date_to_ordinal(date_str: str) -> int:
+    """'YYYY-MM-DD' -> day ordinal."""
+    return date.fromisoformat(date_str).toordinal()
+
+
+def ordinal_to_date(ordinal: int) -> str:
+    """Day ordinal -> 'YYYY-MM-DD'."""
+    return date.fromordinal(ordinal).isoformat()
+
+
+@dataclass(slots=True)
+class Course:
+    course_id: str
+    name: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"course_id": self.course_id, "name": self.name}
+
+    def to_row(self) -> List[Any]:
+        return [self.course_id, self.name]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Course":
+        return cls(course_id=data["course_id"], name=data["name"])
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "Course":
+        return cls(row[0], row[1])
+
+
+@dataclass(slots=True)
+class Task:
+    task_id: str
+    course_id: str
+    title: str
+    deadline: int                       # day ordinal
+    status: TaskStatus = TaskStatus.PENDING
+    # Scheduling constraints (0 / None = no constraint)
+    estimated_minutes: int = 0
+    min_block_minutes: int = 0
+    preferred_time: Optional[str] = None  # "morning" / "afternoon" / "evening"
+    # Effort still to do; starts at estimated_minutes and shrinks with
+    # partial completions (see TaskIndex.set_remaining)
+    remaining_minutes: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        if self.remaining_minutes is None:
+            self.remaining_minutes = self.estimated_minutes
+
+    @property
+    def deadline_date(self) -> str:
+        return ordinal_to_date(self.deadline)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.task_id,
+            "course_id": self.course_id,
+            "title": self.title,
+            "deadline_date": self.deadline_date,
+            "status": self.status.label,
+            "estimated_minutes": self.estimated_minutes,
+            "min_block_minutes": self.min_block_minutes,
+            "preferred_time": self.preferred_time,
+            "remaining_minutes": self.remaining_minutes,
+        }
+
+    def to_row(self) -> List[Any]:
+        return [
+            self.task_id,
+            self.course_id,
+            self.title,
+            self.deadline,
+            int(self.status),
+            self.estimated_minutes,
+            self.min_block_minutes,
+            self.preferred_time,
+            self.remaining_minutes,
+        ]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Task":
+        return cls(
+            task_id=data["task_id"],
+            course_id=data["course_id"],
+            title=data["title"],
+            deadline=date_to_ordinal(data["deadline_date"]),
+            status=TaskStatus.parse(data.get("status")),
+            estimated_minutes=data.get("estimated_minutes") or 0,
+            min_block_minutes=data.get("min_block_minutes") or 0,
+            preferred_time=data.get("preferred_time"),
+            remaining_minutes=data.get("remaining_minutes"),
+        )
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "Task":
+        # Older rows lack the scheduling / effort fields at the end
+        return cls(row[0], row[1], row[2], row[3], TaskStatus(row[4]), *row[5:9])
+
+
+@dataclass(slots=True)
+class HistoryEntry:
+    date: int                           # day ordinal
+    completed_task_ids: Tuple[str, ...]
+    partial_task_ids: Tuple[str, ...]
+    difficulty_rating: int
+    notes: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "date": ordinal_to_date(self.date),
+            "completed_task_ids": list(self.completed_task_ids),
+            "partial_task_ids": list(self.partial_task_ids),
+            "difficulty_rating": self.difficulty_rating,
+            "notes": self.notes,
+        }
+
+    def to_row(self) -> List[Any]:
+        return [
+            self.date,
+            list(self.completed_task_ids),
+            list(self.partial_task_ids),
+            self.difficulty_rating,
+            self.notes,
+        ]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HistoryEntry":
+        return cls(
+            date=date_to_ordinal(data["date"]),
+            completed_task_ids=tuple(data.get("completed_task_ids", ())),
+            partial_task_ids=tuple(data.get("partial_task_ids", ())),
+            difficulty_rating=data.get("difficulty_rating", 3),
+            notes=data.get("notes", ""),
+        )
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "HistoryEntry":
+        return cls(row[0], tuple(row[1]), tuple(row[2]), row[3], row[4])
+
+
+class TaskIndex:
+    """
+    A user's tasks, in insertion order, plus derived indexes:
+    - task_id -> Task, for O(1) lookups
+    - running counts per status, for O(1) progress numbers
+    - the total remaining effort of open tasks
+    - open (not done) tasks sorted by (deadline, insertion order), so
+      planning can take the k most urgent tasks in O(k), also per course
+    - the in-progress tasks
+
+    It iterates like the plain list it replaces. The indexes are kept in
+    sync incrementally, so every change has to go through `add`,
+    `set_status` or `set_remaining`; never assign `task.status` or
+    `task.remaining_minutes` directly.
+    """
+
+    __slots__ = (
+        "_tasks", "_by_id", "_counts", "_seq", "_open", "_open_minutes", "_open_by_course", "_in_progress",
+    )
+
+    def __init__(self, tasks: Iterable[Task] = ()) -> None:
+        self._tasks: List[Task] = []
+        self._by_id: Dict[str, Task] = {}
+        self._counts = [0] * len(TaskStatus)
+        self._seq: Dict[str, int] = {}
+        # (deadline, seq, task); seq is unique, so Tasks are never compared
+        self._open: List[Tuple[int, int, Task]] = []
+        self._open_minutes = 0
+        self._open_by_course: Dict[str, List[Tuple[int, int, Task]]] = {}
+        self._in_progress: Dict[str, Task] = {}
+        for task in tasks:
+            self.add(task)
+
+    def __iter__(self) -> Iterator[Task]:
+        return iter(self._tasks)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, TaskIndex) and self._tasks == other._tasks
+
+    __hash__ = None  # mutable
+
+    def __repr__(self) -> str:
+        return f"TaskIndex({self._tasks!r})"
+
+    # ---------- Mutations ----------
+
+    def add(self, task: Task) -> None:
+        """
+        Append a task. A task with the same task_id as an earlier one
+        replaces it, in its position and in every index.
+        """
+        old = self._by_id.get(task.task_id)
+        if old is None:
+            seq = len(self._tasks)
+            self._tasks.append(task)
+            self._seq[task.task_id] = seq
+        else:
+            seq = self._seq[task.task_id]
+            self._tasks[seq] = task
+            self._counts[old.status] -= 1
+            self._in_progress.pop(old.task_id, None)
+            if old.status is not TaskStatus.DONE:
+                self._remove_open(old)
+                self._open_minutes -= old.remaining_minutes
+        self._by_id[task.task_id] = task
+        self._counts[task.status] += 1
+        if task.status is TaskStatus.IN_PROGRESS:
+            self._in_progress[task.task_id] = task
+        if task.status is not TaskStatus.DONE:
+            self._insert_open(task)
+            self._open_minutes += task.remaining_minutes
+
+    # Keep list-style appends working (store.add_task, older callers).
+    append = add
+
+    def set_status(self, task_id: str, status: TaskStatus) -> Optional[Task]:
+        """Change a task's status; returns the task, or None if unknown."""
+        task = self._by_id.get(task_id)
+        if task is None or task.status is status:
+            return task
+        self._counts[task.status] -= 1
+        self._counts[status] += 1
+        if status is TaskStatus.DONE:
+            self._remove_open(task)
+            self._open_minutes -= task.remaining_minutes
+        elif task.status is TaskStatus.DONE:
+            self._insert_open(task)
+            self._open_minutes += task.remaining_minutes
+        if status is TaskStatus.IN_PROGRESS:
+            self._in_progress[task_id] = task
+        else:
+            self._in_progress.pop(task_id, None)
+        task.status = status
+        return task
+
+    def set_remaining(self, task_id: str, minutes: int) -> Optional[Task]:
+        """Set a task's remaining effort; returns the task, or None if unknown."""
+        task = self._by_id.get(task_id)
+        if task is None:
+            return None
+        if task.status is not TaskStatus.DONE:
+            self._open_minutes += minutes - task.remaining_minutes
+        task.remaining_minutes = minutes
+        return task
+
+    def _insert_open(self, task: Task) -> None:
+        entry = (task.deadline, self._seq[task.task_id], task)
+        insort(self._open, entry)
+        insort(self._open_by_course.setdefault(task.course_id, []), entry)
+
+    def _remove_open(self, task: Task) -> None:
+        key = (task.deadline, self._seq[task.task_id])
+        for entries in (self._open, self._open_by_course.get(task.course_id, [])):
+            i = bisect_left(entries, key)
+            if i < len(entries) and entries[i][2] is task:
+                del entries[i]
+
+    # ---------- Queries ----------
+
+    def get(self, task_id: str) -> Optional[Task]:
+        return self._by_id.get(task_id)
+
+    def open_by_deadline(self, limit: int | None = None) -> List[Task]:
+        """
+        Not-done tasks, earliest deadline first (ties in insertion order).
+        With `limit`, only the first `limit` are returned, in O(limit).
+        """
+        entries = self._open if limit is None else self._open[:limit]
+        return [entry[2] for entry in entries]
+
+    def planning_candidates(self, limit: int, per_course: int = 2) -> List[Task]:
+        """
+        Open tasks worth scoring for a plan: the `limit` most urgent, every
+        in-progress task and the `per_course` most urgent of each course,
+        so urgency is not the only way into the pool. Earliest deadline
+        first, no duplicates; O(limit + in-progress + courses).
+        """
+        entries = self._open[:limit]
+        seen = {entry[1] for entry in entries}
+        extra = [(task.deadline, self._seq[task.task_id], task) for task in self._in_progress.values()]
+        for course_entries in self._open_by_course.values():
+            extra.extend(course_entries[:per_course])
+        for entry in extra:
+            if entry[1] not in seen:
+                seen.add(entry[1])
+                entries.append(entry)
+        entries.sort(key=lambda entry: entry[:2])
+        return [entry[2] for entry in entries]
+
+    def count(self, status: TaskStatus) -> int:
+        return self._counts[status]
+
+    def open_minutes(self) -> int:
+        """Total remaining effort of open tasks (unestimated tasks count 0)."""
+        return self._open_minutes
+
+    def status_counts(self) -> Dict[str, int]:
+        """{"pending": n, "in_progress": n, "done": n}"""
+        return {status.label: self._counts[status] for status in TaskStatus}
+
+
+# ---------- API boundary ----------
+
+def to_jsonable(value: Any) -> Any:
+    """Recursively turn records (and containers of them) into plain JSON data."""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, TaskIndex)):
+        return [to_jsonable(v) for v in value]
+    return value
+
+
+# ---------- Storage format ----------
+
+def from_stored(cls, item: Any):
+    """Build a `cls` record from a stored row (or a legacy dict)."""
+    return cls.from_dict(item) if isinstance(item, dict) else cls.from_row(item)
+
+
+def encode_state(state: Dict[str, Any]) -> str:
+    """Serialize a user state to compact JSON (records as rows)."""
+    stored = dict(state)
+    stored["courses"] = [c.to_row() for c in state["courses"]]
+    stored["tasks"] = [t.to_row() for t in state["tasks"]]
+    stored["history"] = [h.to_row() for h in state["history"]]
+    return json.dumps(stored, separators=(",", ":"))
+
+
+def decode_state(raw: str) -> Dict[str, Any]:
+    """Inverse of `encode_state`."""
+    state = json.loads(raw)
+    state["courses"] = [from_stored(Course, c) for c in state.get("courses", [])]
+    state["tasks"] = TaskIndex(from_stored(Task, t) for t in state.get("tasks", []))
+    state["history"] = [from_stored(HistoryEntry, h) for h in state.get("history", [])]
+    return state
@@ -1,22 +1,112 @@
 # app/memory/store.py
 
-from typing import Dict, Any, List
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List
 
-# Very simple in-memory store.
-# For the capstone this is enough; in production this could be a real database.
-_USER_STORE: Dict[str, Dict[str, Any]] = {}
+from app.config import settings
+from app.domain.memory.backends import (
+    DiskSpillBackend,
+    InMemoryBackend,
+    SQLiteBackend,
+    StoreBackend,
+)
+from app.domain.memory.journal import JournalTransaction
+from app.domain.memory.records import Course, Task, TaskIndex
+from app.domain.tools.summary_compaction_tool import new_summary
+
+
+# Lock striping: each user maps to one of a fixed set of re-entrant locks,
+# so requests for different users rarely contend and nested transactions
+# for the same user (agent -> agent calls) do not deadlock.
+_LOCK_STRIPES = 64
+_USER_LOCKS = [threading.RLock() for _ in range(_LOCK_STRIPES)]
+
+
+def user_lock(user_id: str) -> threading.RLock:
+    """Return the lock guarding `user_id`'s state."""
+    return _USER_LOCKS[hash(user_id) % _LOCK_STRIPES]
+
+
+def _create_backend() -> StoreBackend:
+    """Build the backend selected by STUDYFLOW_STORE_BACKEND."""
+    kind = settings.get_store_backend()
+    max_users = settings.get_cache_max_users()
+    max_bytes = settings.get_cache_max_bytes()
+
+    if kind == "memory":
+        if max_users or max_bytes:
+            return DiskSpillBackend(
+                settings.get_spill_dir(),
+                max_entries=max_users,
+                max_bytes=max_bytes,
+                lock_for=user_lock,
+            )
+        # Very simple in-memory store.
+        # For the capstone this is enough; in production use "sqlite".
+        return InMemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(
+            settings.get_sqlite_path(),
+            flush_interval=settings.get_store_flush_interval(),
+            batch_size=settings.get_store_flush_batch_size(),
+            snapshot_every=settings.get_journal_snapshot_every(),
+            max_entries=max_users,
+            max_bytes=max_bytes,
+            lock_for=user_lock,
+            refresh_interval=settings.get_store_refresh_interval(),
+        )
+    raise RuntimeError(
+        f"Unknown STUDYFLOW_STORE_BACKEND {kind!r}. Use 'memory' or 'sqlite'."
+    )
+
+
+_BACKEND: StoreBackend = _create_backend()
+
+
+def get_backend() -> StoreBackend:
+    """Return the active storage backend."""
+    return _BACKEND
+
+
+def set_backend(backend: StoreBackend) -> StoreBackend:
+    """
+    Swap the storage backend (e.g. for jobs or local experiments).
+    The previous backend is flushed and returned, not closed.
+    """
+    global _BACKEND
+    previous = _BACKEND
+    previous.flush()
+    _BACKEND = backend
+    return previous
+
+
+def flush() -> None:
+    """Write pending user states to durable storage."""
+    _BACKEND.flush()
+
+
+def close() -> None:
+    """Flush and close the backend. Safe to call more than once."""
+    _BACKEND.close()
+
+
+atexit.register(close)
 
 
 def _default_state() -> Dict[str, Any]:
     """Initial state for a new user."""
     return {
-        "courses": [],   # list of course dicts
-        "tasks": [],     # list of task dicts
+        "courses": [],   # list of Course records
+        "tasks": TaskIndex(),  # Task records + id index / status counts
         "profile": {     # simple preferences
             "preferred_block_minutes": 45,
             "max_blocks_per_day": 3,
         },
-        "history": [],   # reflections / past sessions
+        "history": [],   # recent HistoryEntry records (reflections / past sessions)
+        "history_summary": new_summary(),  # older history, compacted
+        "plans": {},     # date -> stored plan (see MemoryAgent.save_plan)
         "session": {     # simple session tracking
             "current_session_id": None,
             "last_interaction_at": None,
@@ -31,31 +121,79 @@ def get_user_state(user_id: str) -> Dict[str, Any]:
     Get the full state for a user.
     If the user does not exist yet, create a default state.
     """
-    if user_id not in _USER_STORE:
-        _USER_STORE[user_id] = _default_state()
-    return _USER_STORE[user_id]
+    with user_lock(user_id):
+        state = _BACKEND.load(user_id)
+        if state is None:
+            state = _default_state()
+            _BACKEND.save(user_id, state)
+    return state
 
 
 def save_user_state(user_id: str, state: Dict[str, Any]) -> None:
     """Persist the full state for a user."""
-    _USER_STORE[user_id] = state
+    _BACKEND.save(user_id, state)
 
 
-def add_course(user_id: str, course: Dict[str, Any]) -> None:
-    """Append a course dict to the user's courses list."""
-    state = get_user_state(user_id)
-    state["courses"].append(course)
-    save_user_state(user_id, state)
+def list_user_ids() -> List[str]:
+    """Return the ids of all users known to the store."""
+    return _BACKEND.user_ids()
 
 
-def add_task(user_id: str, task: Dict[str, Any]) -> None:
-    """Append a task dict to the user's tasks list."""
-    state = get_user_state(user_id)
-    state["tasks"].append(task)
-    save_user_state(user_id, state)
+@contextmanager
+def transaction(user_id: str, readonly: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Atomic read-modify-write of one user's state:
+
+        with store.transaction(user_id) as state:
+            state["session"]["interaction_count"] += 1
+
+    The user's lock is held for the whole block and the state is saved
+    on a clean exit. Pass readonly=True to get a consistent view without
+    marking the user dirty; for an unknown user it yields a throwaway
+    default state and allocates nothing. Changes made before an exception
+    are not rolled back, only left unsaved until the next write.
+    """
+    with user_lock(user_id):
+        if readonly:
+            yield _BACKEND.load(user_id) or _default_state()
+            return
+        state = get_user_state(user_id)
+        yield state
+        save_user_state(user_id, state)
+
+
+@contextmanager
+def journaled(user_id: str) -> Iterator[JournalTransaction]:
+    """
+    Like `transaction`, but changes are made by appending journal events:
+
+        with store.journaled(user_id) as txn:
+            txn.append(journal.history_appended(entry))
+
+    Each event is applied to the live state immediately (`txn.state`) and
+    handed to the backend on a clean exit, which can persist it without
+    rewriting the whole user state.
+    """
+    with user_lock(user_id):
+        txn = JournalTransaction(get_user_state(user_id))
+        yield txn
+        if txn.events:
+            _BACKEND.append_events(user_id, txn.state, txn.events)
+
+
+def add_course(user_id: str, course: Course) -> None:
+    """Append a course to the user's courses list."""
+    with transaction(user_id) as state:
+        state["courses"].append(course)
+
+
+def add_task(user_id: str, task: Task) -> None:
+    """Append a task to the user's tasks list."""
+    with transaction(user_id) as state:
+        state["tasks"].append(task)
 
 
-def list_tasks(user_id: str) -> List[Dict[str, Any]]:
+def list_tasks(user_id: str) -> List[Task]:
     """Return all tasks for the user."""
     state = get_user_state(user_id)
     return state["tasks"]
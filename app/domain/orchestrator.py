@@ -1,11 +1,20 @@
 # app/domain/orchestrator.py
 
-from typing import Any, Dict, List
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Tuple
 
 from app.domain.agents.memory_agent import MemoryAgent
 from app.domain.agents.planner_agent import PlannerAgent
 from app.domain.agents.reflection_agent import ReflectionAgent
-from app.llm.tools import generate_reflection_feedback
+from app.domain.feedback_jobs import get_feedback_jobs
+from app.domain.memory.records import ordinal_to_date
+from app.llm.tools import (
+    generate_reflection_feedback,
+    generate_reflection_feedback_async,
+    llm_cache_stats,
+    llm_usage_stats,
+    stream_reflection_feedback,
+)
 
 
 memory_agent = MemoryAgent()
@@ -52,17 +61,106 @@ def plan_day(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     {
         "date": "2025-11-28",
         "available_windows": [...],
+        "busy_windows": [...],                  # optional
         "session_id": "optional-session-id"
     }
     """
     date_str = payload["date"]
     available_windows: List[Dict[str, str]] = payload["available_windows"]
+    busy_windows: List[Dict[str, str]] = payload.get("busy_windows") or []
     session_id = payload.get("session_id")
 
     # Update session info (or start a new one if none)
     session = memory_agent.start_or_continue_session(user_id, session_id=session_id)
 
-    plan = planner_agent.plan_day(user_id, date_str, available_windows)
+    plan = planner_agent.plan_day(user_id, date_str, available_windows, busy_windows)
+    plan["session"] = session
+    return plan
+
+
+async def plan_day_async(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `plan_day` for async routes: the event loop is only held while
+    awaiting the LLM, state work runs on worker threads.
+    """
+    session = await asyncio.to_thread(
+        memory_agent.start_or_continue_session, user_id, payload.get("session_id")
+    )
+
+    plan = await planner_agent.plan_day_async(
+        user_id,
+        payload["date"],
+        payload["available_windows"],
+        payload.get("busy_windows") or [],
+    )
+    plan["session"] = session
+    return plan
+
+
+async def plan_day_stream(user_id: str, payload: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    `plan_day` as (event, data) pairs for streaming routes: the "plan"
+    event (blocks + session) comes before the LLM summary text.
+    """
+    session = await asyncio.to_thread(
+        memory_agent.start_or_continue_session, user_id, payload.get("session_id")
+    )
+
+    events = planner_agent.plan_day_stream(
+        user_id,
+        payload["date"],
+        payload["available_windows"],
+        payload.get("busy_windows") or [],
+    )
+    async for event, data in events:
+        if event == "plan":
+            data["session"] = session
+        yield event, data
+
+
+def plan_range(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Plan study blocks for several days in one call.
+
+    payload example:
+    {
+        "start_date": "2025-11-28",
+        "end_date": "2025-12-04",
+        "windows_by_day": {"2025-11-29": [...]},
+        "default_windows": [...],
+        "session_id": "optional-session-id"
+    }
+    """
+    session = memory_agent.start_or_continue_session(
+        user_id, session_id=payload.get("session_id")
+    )
+
+    plan = planner_agent.plan_range(
+        user_id,
+        payload["start_date"],
+        payload["end_date"],
+        payload.get("windows_by_day", {}),
+        payload.get("default_windows"),
+    )
+    plan["session"] = session
+    return plan
+
+
+async def plan_range_async(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `plan_range` for async routes.
+    """
+    session = await asyncio.to_thread(
+        memory_agent.start_or_continue_session, user_id, payload.get("session_id")
+    )
+
+    plan = await planner_agent.plan_range_async(
+        user_id,
+        payload["start_date"],
+        payload["end_date"],
+        payload.get("windows_by_day", {}),
+        payload.get("default_windows"),
+    )
     plan["session"] = session
     return plan
 
@@ -73,14 +171,87 @@ def reflect(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
       - update tasks & history
       - adapt profile
       - update session
-      - generate LLM feedback
+      - generate LLM feedback (or queue it, with payload["defer_feedback"])
       - return combined result
     """
+    if payload.get("defer_feedback"):
+        return _reflect_deferred(user_id, payload)
+
+    result, status = _reflect_state(user_id, payload)
+
+    # 5. LLM feedback
+    result["feedback_text"] = generate_reflection_feedback(
+        result["history_entry"].to_dict(), status, user_id
+    )
+    return result
+
+
+async def reflect_async(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `reflect` for async routes: state updates on a worker thread, then
+    the LLM feedback is awaited.
+    """
+    if payload.get("defer_feedback"):
+        return await asyncio.to_thread(_reflect_deferred, user_id, payload)
+
+    result, status = await asyncio.to_thread(_reflect_state, user_id, payload)
+    result["feedback_text"] = await generate_reflection_feedback_async(
+        result["history_entry"].to_dict(), status, user_id
+    )
+    return result
+
+
+async def reflect_stream(user_id: str, payload: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    `reflect` as (event, data) pairs: "reflection" with the state updates
+    and plan patch, "feedback" pieces of LLM text, then "done".
+    """
+    result, status = await asyncio.to_thread(_reflect_state, user_id, payload)
+    yield "reflection", result
+
+    async for text in stream_reflection_feedback(result["history_entry"].to_dict(), status, user_id):
+        yield "feedback", {"text": text}
+    yield "done", {}
+
+
+def _reflect_deferred(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Save the reflection and queue its feedback. Returns right away with
+    feedback_text None and a `feedback_job` to poll. Raises
+    QueueFullError, before any state changes, when the queue is full.
+    """
+    jobs = get_feedback_jobs()
+    job_id = jobs.reserve(user_id)
+    try:
+        result, status = _reflect_state(user_id, payload)
+    except BaseException:
+        jobs.release(job_id)
+        raise
+    job = jobs.submit(job_id, result["history_entry"].to_dict(), status)
+    result["feedback_text"] = None
+    result["feedback_job"] = {"job_id": job["job_id"], "status": job["status"]}
+    return result
+
+
+async def get_feedback_job(user_id: str, job_id: str, wait: float = 0.0) -> Dict[str, Any] | None:
+    """
+    Return a deferred feedback job (None if unknown or expired), waiting
+    up to `wait` seconds for it to finish.
+    """
+    return await get_feedback_jobs().wait(user_id, job_id, wait)
+
+
+def _reflect_state(user_id: str, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Steps 1-4 of a reflection (everything but the LLM call). Returns the
+    result without feedback_text, and the status the feedback is based on.
+    """
     completed_task_ids = payload.get("completed_task_ids", [])
     partial_task_ids = payload.get("partial_task_ids", [])
     difficulty_rating = payload.get("difficulty_rating", 3)
     notes = payload.get("notes", "")
     date_str = payload.get("date")
+    minutes_spent = payload.get("minutes_spent")
 
     # 1. Core reflection logic (updates state)
     reflection_result = reflection_agent.reflect(
@@ -90,27 +261,45 @@ def reflect(user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         difficulty_rating=difficulty_rating,
         notes=notes,
         date_str=date_str,
+        minutes_spent=minutes_spent,
     )
 
     history_entry = reflection_result["history_entry"]
     profile = reflection_result["updated_profile"]
 
-    # 2. Update / continue session
+    # 2. Patch the stored plan for that day (no replanning, no LLM call),
+    #    and the nightly plans for later days that /plan_day may serve
+    entry_date = ordinal_to_date(history_entry.date)
+    plan_patch = planner_agent.patch_plan(user_id, entry_date)
+    planner_agent.patch_precomputed(user_id, entry_date)
+
+    # 3. Update / continue session
     session = memory_agent.start_or_continue_session(user_id)
 
-    # 3. Get status for feedback
+    # 4. Get status for feedback
     status = memory_agent.get_status(user_id)
 
-    # 4. LLM feedback
-    feedback_text = generate_reflection_feedback(history_entry, status)
-
-    # 5. Combined result
-    return {
+    result = {
         "history_entry": history_entry,
         "updated_profile": profile,
         "session": session,
-        "feedback_text": feedback_text,
+        "plan_patch": plan_patch,
     }
+    return result, status
+
+
+def get_plan(user_id: str, date_str: str) -> Dict[str, Any] | None:
+    """
+    Return the stored plan for a date (None if nothing was planned).
+    """
+    return memory_agent.get_plan(user_id, date_str)
+
+
+def get_plan_diff(user_id: str, date_str: str, since_version: int) -> Dict[str, Any] | None:
+    """
+    Return what changed in a date's plan since the client's version.
+    """
+    return memory_agent.get_plan_diff(user_id, date_str, since_version)
 
 
 def get_status(user_id: str) -> Dict[str, Any]:
@@ -120,3 +309,21 @@ def get_status(user_id: str) -> Dict[str, Any]:
     status = memory_agent.get_status(user_id)
     status["session"] = memory_agent.get_session_info(user_id)
     return status
+
+
+def get_llm_cache_stats() -> Dict[str, Any]:
+    """
+    Return the LLM response cache counters (hits, misses, saved time)
+    and the deferred feedback queue's counters.
+    """
+    stats = llm_cache_stats()
+    stats["feedback_jobs"] = get_feedback_jobs().stats()
+    return stats
+
+
+def get_llm_usage(user_id: str | None = None) -> Dict[str, Any] | None:
+    """
+    Return LLM token counters per endpoint (and the heaviest users), or
+    one user's counters (None if that user made no LLM request yet).
+    """
+    return llm_usage_stats(user_id)
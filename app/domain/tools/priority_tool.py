@@ -0,0 +1,160 @@
+# app/domain/tools/priority_tool.py
+
+"""
+Priority scoring for study tasks.
+
+Each task gets a score in [0, 1] from a weighted sum of features:
+- deadline proximity (days left until the deadline, relative to the plan date)
+- in-progress status (finish what was started)
+- how often the task was reported as partial in recent reflections
+- course balance (courses that got little recent work come first)
+- past difficulty of the task's course (hard courses start earlier)
+
+`score_tasks` scores a whole batch in one vectorized NumPy pass over
+per-task feature arrays; `top_k` picks the best k without sorting the
+rest. History-derived features are summarised once per request by
+`history_signals`.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from app.domain.memory.records import HistoryEntry, Task, TaskStatus
+
+
+@dataclass(frozen=True)
+class PriorityWeights:
+    deadline: float = 0.5
+    in_progress: float = 0.15
+    partial: float = 0.1
+    balance: float = 0.15
+    difficulty: float = 0.1
+
+    @property
+    def total(self) -> float:
+        return self.deadline + self.in_progress + self.partial + self.balance + self.difficulty
+
+
+DEFAULT_WEIGHTS = PriorityWeights()
+
+# Days-left at which deadline urgency halves (1 / (1 + days / scale)).
+URGENCY_SCALE_DAYS = 7.0
+# Partial reports after which the "partial" feature saturates.
+PARTIAL_SATURATION = 3
+
+
+@dataclass
+class HistorySignals:
+    """Per-task and per-course aggregates over recent reflections."""
+    partial_counts: Dict[str, int] = field(default_factory=dict)     # task_id -> times partial
+    course_share: Dict[str, float] = field(default_factory=dict)     # course_id -> share of recent work
+    course_difficulty: Dict[str, float] = field(default_factory=dict)  # course_id -> mean rating (1-5)
+
+
+def history_signals(
+    history: Iterable[HistoryEntry],
+    course_of: Dict[str, str],
+) -> HistorySignals:
+    """
+    Summarise recent history entries. `course_of` maps the task ids that
+    appear in them to their course ids (unknown ids are ignored).
+    """
+    partial_counts: Counter = Counter()
+    work: Counter = Counter()
+    rating_sum: Counter = Counter()
+    rating_n: Counter = Counter()
+
+    for entry in history:
+        partial_counts.update(entry.partial_task_ids)
+        courses = set()
+        for tid in (*entry.completed_task_ids, *entry.partial_task_ids):
+            course = course_of.get(tid)
+            if course is not None:
+                work[course] += 1
+                courses.add(course)
+        for course in courses:
+            rating_sum[course] += entry.difficulty_rating
+            rating_n[course] += 1
+
+    total_work = sum(work.values())
+    return HistorySignals(
+        partial_counts=dict(partial_counts),
+        course_share={c: n / total_work for c, n in work.items()} if total_work else {},
+        course_difficulty={c: rating_sum[c] / rating_n[c] for c in rating_n},
+    )
+
+
+def score_tasks(
+    tasks: Sequence[Task],
+    today: int,
+    signals: HistorySignals | None = None,
+    weights: PriorityWeights = DEFAULT_WEIGHTS,
+) -> np.ndarray:
+    """
+    Score all `tasks` in one vectorized pass. `today` is the plan date as
+    a day ordinal. Returns a float array aligned with `tasks`.
+    """
+    n = len(tasks)
+    if n == 0:
+        return np.zeros(0)
+    signals = signals or HistorySignals()
+
+    # Gather raw per-task columns (one Python pass), then compute in NumPy.
+    deadlines = np.fromiter((t.deadline for t in tasks), dtype=np.int64, count=n)
+    statuses = np.fromiter((t.status for t in tasks), dtype=np.int8, count=n)
+    partials = np.fromiter(
+        (signals.partial_counts.get(t.task_id, 0) for t in tasks), dtype=np.float64, count=n
+    )
+    shares = np.fromiter(
+        (signals.course_share.get(t.course_id, 0.0) for t in tasks), dtype=np.float64, count=n
+    )
+    # Unknown difficulty is neutral (3 on the 1-5 scale).
+    ratings = np.fromiter(
+        (signals.course_difficulty.get(t.course_id, 3.0) for t in tasks), dtype=np.float64, count=n
+    )
+
+    days_left = np.clip(deadlines - today, 0, None)
+    urgency = 1.0 / (1.0 + days_left / URGENCY_SCALE_DAYS)
+    in_progress = (statuses == TaskStatus.IN_PROGRESS).astype(np.float64)
+    partial = np.minimum(partials / PARTIAL_SATURATION, 1.0)
+    balance = 1.0 - shares
+    difficulty = np.clip((ratings - 1.0) / 4.0, 0.0, 1.0)
+
+    score = (
+        weights.deadline * urgency
+        + weights.in_progress * in_progress
+        + weights.partial * partial
+        + weights.balance * balance
+        + weights.difficulty * difficulty
+    )
+    return score / weights.total
+
+
+def top_k(tasks: Sequence[Task], scores: np.ndarray, k: int) -> List[Tuple[Task, float]]:
+    """
+    The k highest-scoring tasks, best first. Uses argpartition, so only the
+    selected k are sorted. Ties keep the input order.
+    """
+    n = len(tasks)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    if k < n:
+        picked = np.argpartition(-scores, k - 1)[:k]
+    else:
+        picked = np.arange(n)
+    # Sort the picked ones by score desc, then original position.
+    order = picked[np.lexsort((picked, -scores[picked]))]
+    return [(tasks[i], float(scores[i])) for i in order]
+
+
+def priority_label(score: float) -> str:
+    """Bucket a score into the "high" / "medium" / "low" shown on blocks."""
+    if score >= 0.5:
+        return "high"
+    if score >= 0.3:
+        return "medium"
+    return "low"
@@ -1,35 +1,592 @@
 # app/tools/scheduling_tool.py
 
-from datetime import datetime, time, timedelta
-from typing import List, Dict, Any, Tuple
+import heapq
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Any, Callable, Iterable, Optional, Sequence, Tuple
 
+import numpy as np
 
-def _parse_time(t: str) -> time:
-    """Parse 'HH:MM' into a time object."""
-    return datetime.strptime(t, "%H:%M").time()
+from app.domain.memory.records import Task, date_to_ordinal, ordinal_to_date
 
+# Longest range plan_range / schedule_range accept, in days.
+MAX_RANGE_DAYS = 31
 
-def _split_into_blocks(start: time, end: time, block_minutes: int) -> List[Tuple[time, time]]:
+MINUTES_PER_DAY = 24 * 60
+
+# Availability is handled at minute resolution as a sorted, disjoint list
+# of half-open intervals [start, end) in minutes since midnight. The set
+# operations below are linear merges over interval endpoints, so their cost
+# depends on the number of windows, not on how many minutes they span.
+Interval = Tuple[int, int]
+Block = Tuple[int, int]
+
+
+@lru_cache(maxsize=4096)
+def _parse_minutes(t: str) -> int:
+    """Parse 'HH:MM' (00:00-24:00) into minutes since midnight."""
+    hours, sep, minutes = t.partition(":")
+    if not (sep and hours.isdigit() and minutes.isdigit() and len(minutes) == 2):
+        raise ValueError(f"Invalid time {t!r}, expected HH:MM")
+    value = int(hours) * 60 + int(minutes)
+    if int(minutes) >= 60 or value > MINUTES_PER_DAY:
+        raise ValueError(f"Invalid time {t!r}, expected HH:MM")
+    return value
+
+
+def _format_minutes(m: int) -> str:
+    """Minutes since midnight -> 'HH:MM'."""
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def normalize(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort intervals, drop empty ones and merge those that overlap or touch."""
+    merged: List[Interval] = []
+    for start, end in sorted(i for i in intervals if i[0] < i[1]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def windows_to_intervals(windows: Iterable[Dict[str, str]]) -> List[Interval]:
     """
-    Split a time window into fixed-length blocks.
-    Example: 19:00–21:00 with 45 min blocks -> [(19:00, 19:45), (19:45, 20:30)]
+    {"start": "HH:MM", "end": "HH:MM"} windows -> normalized interval set.
+    Overlapping or unsorted windows are merged, so no minute is counted twice.
     """
-    blocks: List[Tuple[time, time]] = []
-    current = datetime.combine(datetime.today(), start)
-    end_dt = datetime.combine(datetime.today(), end)
-    delta = timedelta(minutes=block_minutes)
+    return normalize(window_bounds(windows))
+
+
+def window_bounds(windows: Iterable[Dict[str, str]]) -> List[Interval]:
+    """{"start": "HH:MM", "end": "HH:MM"} windows -> (start, end) minutes, as given."""
+    return [(_parse_minutes(w["start"]), _parse_minutes(w["end"])) for w in windows]
+
+
+def union(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """Minutes in either set."""
+    return normalize(heapq.merge(a, b))
+
 
-    while current + delta <= end_dt:
-        block_start = current.time()
-        block_end = (current + delta).time()
-        blocks.append((block_start, block_end))
-        current += delta
+def intersect(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """Minutes in both sets (both normalized)."""
+    result: List[Interval] = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        # Advance whichever interval ends first
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
 
+
+def subtract(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """Minutes in `a` but not in `b` (both normalized)."""
+    result: List[Interval] = []
+    j = 0
+    for start, end in a:
+        # Skip busy intervals that end before this one starts
+        while j < len(b) and b[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] < end:
+            if b[k][0] > start:
+                result.append((start, b[k][0]))
+            start = max(start, b[k][1])
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def extract_blocks(
+    free: List[Interval],
+    block_minutes: int,
+    limit: Optional[int] = None,
+    gap_minutes: int = 0,
+    break_every: int = 0,
+    break_minutes: int = 0,
+) -> List[Block]:
+    """
+    Cut fixed-length blocks out of a normalized interval set, earliest first.
+    Example: 19:00–21:00 with 45 min blocks -> [(19:00, 19:45), (19:45, 20:30)]
+
+    `gap_minutes` separates consecutive blocks; after every `break_every`
+    back-to-back blocks a `break_minutes` pause is used instead. Each free
+    interval starts a new run. Stops after `limit` blocks.
+    """
+    if block_minutes <= 0:
+        raise ValueError("block_minutes must be positive")
+
+    blocks: List[Block] = []
+    for start, end in free:
+        cursor, run = start, 0
+        while cursor + block_minutes <= end:
+            if limit is not None and len(blocks) >= limit:
+                return blocks
+            blocks.append((cursor, cursor + block_minutes))
+            run += 1
+            pause = break_minutes if break_every and run % break_every == 0 else gap_minutes
+            cursor += block_minutes + pause
     return blocks
 
 
+def available_blocks(
+    available_windows: List[Dict[str, str]],
+    block_minutes: int = 45,
+    max_blocks_per_day: int = 3,
+    busy_windows: Optional[List[Dict[str, str]]] = None,
+    gap_minutes: int = 0,
+    break_every: int = 0,
+    break_minutes: int = 0,
+) -> List[Block]:
+    """
+    All study blocks that fit in the day's windows minus its busy windows,
+    capped at max_blocks_per_day, as (start, end) minutes since midnight.
+    Its length is how many tasks a plan can use.
+    """
+    free = windows_to_intervals(available_windows)
+    if busy_windows:
+        free = subtract(free, windows_to_intervals(busy_windows))
+    return extract_blocks(
+        free,
+        block_minutes,
+        limit=max_blocks_per_day,
+        gap_minutes=gap_minutes,
+        break_every=break_every,
+        break_minutes=break_minutes,
+    )
+
+
+def study_block(task: Task, date_str: str, block: Block, priority: str) -> Dict[str, Any]:
+    """The API dict for one planned block."""
+    block_start, block_end = block
+    return {
+        "date": date_str,
+        "start_time": _format_minutes(block_start),
+        "end_time": _format_minutes(block_end),
+        "task_id": task.task_id,
+        "course_id": task.course_id,
+        "title": task.title,
+        "priority": priority,
+    }
+
+
+# ---------- Constraint scheduling ----------
+
+# Minute ranges for a task's preferred_time.
+PREFERRED_TIME_RANGES: Dict[str, Interval] = {
+    "morning": (5 * 60, 12 * 60),
+    "afternoon": (12 * 60, 17 * 60),
+    "evening": (17 * 60, MINUTES_PER_DAY),
+}
+# Added to a task's value when its block starts in its preferred range.
+PREFERRED_TIME_BONUS = 0.1
+# Each further block of the same task on one day is worth this much of the
+# previous one, so a day mixes tasks unless one clearly dominates.
+CHUNK_VALUE_DECAY = 0.85
+
+
+@dataclass
+class ScheduleQuality:
+    """How good a constrained schedule is, and what it cost to find."""
+    objective: float            # sum of placed block values
+    upper_bound: float          # best possible objective, ignoring time overlaps
+    placed: int                 # blocks
+    tasks: int                  # distinct tasks among the blocks
+    candidates: int
+    preferred_time_hits: int
+    planned_minutes: int
+    free_minutes: int
+    iterations: int             # local search passes
+    elapsed_ms: float
+    budget_exhausted: bool
+
+    @property
+    def ratio(self) -> float:
+        return self.objective / self.upper_bound if self.upper_bound else 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "objective": round(self.objective, 4),
+            "upper_bound": round(self.upper_bound, 4),
+            "ratio": round(self.ratio, 4),
+            "placed": self.placed,
+            "tasks": self.tasks,
+            "candidates": self.candidates,
+            "preferred_time_hits": self.preferred_time_hits,
+            "planned_minutes": self.planned_minutes,
+            "free_minutes": self.free_minutes,
+            "utilization": round(self.planned_minutes / self.free_minutes, 4) if self.free_minutes else 0.0,
+            "iterations": self.iterations,
+            "elapsed_ms": round(self.elapsed_ms, 3),
+            "budget_exhausted": self.budget_exhausted,
+        }
+
+
+def effort_chunks(task: Task, preferred_block_minutes: int, limit: int) -> List[int]:
+    """
+    Block lengths covering a task's remaining effort: preferred-length
+    blocks, the last one shorter, none below the task's minimum block.
+    A task without an estimate gets one preferred block. At most `limit`.
+    Example: 100 min left, 45 min blocks -> [45, 45, 10]
+    """
+    left = task.remaining_minutes or preferred_block_minutes
+    chunks: List[int] = []
+    while left > 0 and len(chunks) < limit:
+        length = max(min(left, preferred_block_minutes), task.min_block_minutes)
+        chunks.append(length)
+        left -= length
+    return chunks
+
+
+def _earliest_fit(
+    free: List[Interval],
+    length: int,
+    within: Optional[Interval] = None,
+    ok: Optional[Callable[[int], bool]] = None,
+    also: Sequence[int] = (),
+) -> Optional[int]:
+    """
+    Earliest start where `length` minutes fit in `free` (and in `within`)
+    and `ok(start)` holds. Besides interval starts, the points in `also`
+    are tried.
+    """
+    for start, end in free:
+        if within is not None:
+            start, end = max(start, within[0]), min(end, within[1])
+        if end - start < length:
+            continue
+        if ok is None:
+            return start
+        for point in sorted({start, *(p for p in also if start < p <= end - length)}):
+            if ok(point):
+                return point
+    return None
+
+
+def _breaks_ok(spans: Sequence[Interval], break_every: int, break_minutes: int) -> bool:
+    """
+    True if no more than `break_every` sorted blocks follow each other
+    without a `break_minutes` pause (the rule `extract_blocks` applies).
+    """
+    if not break_every:
+        return True
+    run, prev_end = 0, None
+    for start, end in spans:
+        run = run + 1 if prev_end is not None and start - prev_end < break_minutes else 1
+        if run > break_every:
+            return False
+        prev_end = end
+    return True
+
+
+def schedule_constrained(
+    ranked: Sequence[Tuple[Task, float]],
+    free: List[Interval],
+    preferred_block_minutes: int = 45,
+    max_blocks_per_day: int = 3,
+    time_budget_ms: float = 20.0,
+    gap_minutes: int = 0,
+    break_every: int = 0,
+    break_minutes: int = 0,
+) -> Tuple[List[Tuple[Task, Block]], ScheduleQuality]:
+    """
+    Place scored tasks into a day's free intervals under the profile and
+    per-task constraints:
+    - a task's remaining effort is split into blocks (`effort_chunks`);
+      later blocks of the same task are worth less
+    - at most `max_blocks_per_day` blocks, no overlaps
+    - blocks in the task's preferred time of day are worth a bonus
+    - blocks are at least `gap_minutes` apart, and after `break_every`
+      blocks in a row comes a `break_minutes` pause, as in `extract_blocks`
+
+    A greedy pass (best value first, earliest fitting slot) gives the
+    start; local search then relocates blocks into preferred ranges and
+    swaps in better unplaced tasks until nothing improves or
+    `time_budget_ms` is spent. Only the given candidates are considered,
+    so the work is bounded by the candidate pool, not the backlog.
+
+    Returns (task, block) pairs in chronological order and a quality report.
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget_ms / 1000.0
+
+    # Every block a task could use is a separate item
+    items: List[Tuple[Task, float]] = []
+    lengths: List[int] = []
+    for task, score in ranked:
+        for k, length in enumerate(effort_chunks(task, preferred_block_minutes, max_blocks_per_day)):
+            items.append((task, score * CHUNK_VALUE_DECAY ** k))
+            lengths.append(length)
+    prefs = [PREFERRED_TIME_RANGES.get(task.preferred_time) for task, _ in items]
+
+    def value(i: int, start: int) -> float:
+        pref = prefs[i]
+        bonus = PREFERRED_TIME_BONUS if pref is not None and pref[0] <= start < pref[1] else 0.0
+        return items[i][1] + bonus
+
+    def best_value(i: int) -> float:
+        return items[i][1] + (PREFERRED_TIME_BONUS if prefs[i] is not None else 0.0)
+
+    placed: Dict[int, int] = {}         # candidate index -> block start
+
+    def place(i: int, skip: Optional[int] = None, preferred_only: bool = False) -> Optional[int]:
+        # Earliest start for candidate i among the placed blocks (without
+        # `skip`): in its preferred range if possible, keeping the spacing
+        others = sorted((start, start + lengths[j]) for j, start in placed.items() if j != skip)
+        room = subtract(free, normalize((start - gap_minutes, end + gap_minutes) for start, end in others))
+        ok = None
+        if break_every:
+            ok = lambda start: _breaks_ok(
+                sorted(others + [(start, start + lengths[i])]), break_every, break_minutes
+            )
+        # A run can only be ended by starting a break after a placed block
+        also = [end + break_minutes for _, end in others]
+        if prefs[i] is not None:
+            start = _earliest_fit(room, lengths[i], prefs[i], ok, also)
+            if start is not None or preferred_only:
+                return start
+        elif preferred_only:
+            return None
+        return _earliest_fit(room, lengths[i], None, ok, also)
+
+    # 1. Greedy start: best possible value first, earliest fitting slot
+    order = sorted(range(len(items)), key=lambda i: -best_value(i))
+    for i in order:
+        if len(placed) >= max_blocks_per_day:
+            break
+        start = place(i)
+        if start is not None:
+            placed[i] = start
+
+    # 2. Local search, bounded by the time budget
+    iterations = 0
+    exhausted = False
+    improved = True
+    while improved:
+        if time.perf_counter() >= deadline:
+            exhausted = True
+            break
+        improved = False
+        iterations += 1
+
+        # a) Move blocks that miss their preferred range into it
+        for i, start in list(placed.items()):
+            if prefs[i] is None or value(i, start) > items[i][1]:
+                continue
+            new_start = place(i, skip=i, preferred_only=True)
+            if new_start is not None:
+                placed[i] = new_start
+                improved = True
+
+        # b) Fill spare capacity with unplaced tasks
+        for i in order:
+            if len(placed) >= max_blocks_per_day:
+                break
+            if i in placed:
+                continue
+            start = place(i)
+            if start is not None:
+                placed[i] = start
+                improved = True
+
+        # c) Swap a placed task for a better unplaced one
+        for u in order:
+            if u in placed:
+                continue
+            if time.perf_counter() >= deadline:
+                exhausted = True
+                break
+            # Cheapest placed task first; `order` is by best value, so once
+            # u cannot beat the cheapest one, no later task can either
+            cheapest = sorted(placed, key=lambda j: value(j, placed[j]))
+            if not cheapest or best_value(u) <= value(cheapest[0], placed[cheapest[0]]):
+                break
+            for s in cheapest:
+                current = value(s, placed[s])
+                if best_value(u) <= current:
+                    break
+                start = place(u, skip=s)
+                if start is not None and value(u, start) > current:
+                    del placed[s]
+                    placed[u] = start
+                    improved = True
+                    break
+        if exhausted:
+            break
+
+    placements = sorted(
+        ((items[i][0], (start, start + lengths[i])) for i, start in placed.items()),
+        key=lambda p: p[1],
+    )
+    planned = sum(lengths[i] for i in placed)
+    best_values = sorted((best_value(i) for i in range(len(items))), reverse=True)
+    quality = ScheduleQuality(
+        objective=sum(value(i, start) for i, start in placed.items()),
+        upper_bound=sum(best_values[:max_blocks_per_day]),
+        placed=len(placed),
+        tasks=len({id(items[i][0]) for i in placed}),
+        candidates=len(ranked),
+        preferred_time_hits=sum(1 for i, start in placed.items() if value(i, start) > items[i][1]),
+        planned_minutes=planned,
+        free_minutes=sum(end - start for start, end in free),
+        iterations=iterations,
+        elapsed_ms=(time.perf_counter() - started) * 1000.0,
+        budget_exhausted=exhausted,
+    )
+    return placements, quality
+
+
+# ---------- Plan diffs ----------
+
+def block_key(block: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    """Identity of a planned block: (date, start_time, end_time, task_id)."""
+    return (block["date"], block["start_time"], block["end_time"], block["task_id"])
+
+
+def refill_block(block: Dict[str, Any], task: Task, priority: str) -> Dict[str, Any]:
+    """The same time slot as `block`, given to another task."""
+    return {
+        **block,
+        "task_id": task.task_id,
+        "course_id": task.course_id,
+        "title": task.title,
+        "priority": priority,
+    }
+
+
+def diff_blocks(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Blocks removed from and added to a plan, by `block_key`."""
+    old_keys = {block_key(b) for b in old}
+    new_keys = {block_key(b) for b in new}
+    return {
+        "removed": [b for b in old if block_key(b) not in new_keys],
+        "added": [b for b in new if block_key(b) not in old_keys],
+    }
+
+
+def merge_diffs(diffs: Iterable[Dict[str, List[Dict[str, Any]]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Collapse consecutive diffs into one; a block added and later removed
+    (or the reverse) cancels out.
+    """
+    removed: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+    added: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+    for diff in diffs:
+        for b in diff["removed"]:
+            key = block_key(b)
+            if key in added:
+                del added[key]
+            else:
+                removed[key] = b
+        for b in diff["added"]:
+            key = block_key(b)
+            if key in removed:
+                del removed[key]
+            else:
+                added[key] = b
+    return {"removed": list(removed.values()), "added": list(added.values())}
+
+
+def range_timeline(
+    start_date: str,
+    end_date: str,
+    windows_by_day: Dict[str, List[Dict[str, str]]],
+    default_windows: Optional[List[Dict[str, str]]] = None,
+    block_minutes: int = 45,
+    max_blocks_per_day: int = 3,
+    gap_minutes: int = 0,
+    break_every: int = 0,
+    break_minutes: int = 0,
+) -> List[Tuple[int, Block]]:
+    """
+    Merged timeline for a date range: every free block of every day as
+    (day ordinal, (start, end)), in chronological order. Days missing from
+    `windows_by_day` use `default_windows` (or have no blocks). Spacing
+    options are those of `extract_blocks`.
+    """
+    start = date_to_ordinal(start_date)
+    end = date_to_ordinal(end_date)
+    if end < start:
+        raise ValueError(f"end_date {end_date} is before start_date {start_date}")
+    if end - start + 1 > MAX_RANGE_DAYS:
+        raise ValueError(f"Date range is longer than {MAX_RANGE_DAYS} days")
+
+    timeline: List[Tuple[int, Block]] = []
+    for day in range(start, end + 1):
+        windows = windows_by_day.get(ordinal_to_date(day), default_windows) or []
+        blocks = available_blocks(
+            windows,
+            block_minutes,
+            max_blocks_per_day,
+            gap_minutes=gap_minutes,
+            break_every=break_every,
+            break_minutes=break_minutes,
+        )
+        for block in blocks:
+            timeline.append((day, block))
+    return timeline
+
+
+def schedule_range(
+    ordered_tasks: Sequence[Task],
+    timeline: List[Tuple[int, Block]],
+    priorities: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Allocate tasks across a multi-day timeline (see `range_timeline`) in
+    one chronological pass, earliest deadline first: each block goes to the
+    open task with the nearest deadline that has not passed yet; ties keep
+    the order of `ordered_tasks` (e.g. priority order). A task keeps
+    getting blocks until its remaining effort is covered (one block if it
+    has no estimate); a block longer than what is left is trimmed. Overdue
+    tasks count as due on the first day. A task whose deadline passes
+    before it is covered is dropped. `priorities` maps task_id -> label.
+    """
+    if not ordered_tasks or not timeline:
+        return []
+
+    first_day = timeline[0][0]
+    heap = [(max(task.deadline, first_day), i, task) for i, task in enumerate(ordered_tasks)]
+    heapq.heapify(heap)
+    # Minutes still to place per task; 0 = no estimate (one full block)
+    left = {i: task.remaining_minutes for i, task in enumerate(ordered_tasks)}
+
+    study_blocks: List[Dict[str, Any]] = []
+    current_day, day_str = None, ""
+    for day, block in timeline:
+        # Drop tasks that are already past their deadline
+        while heap and heap[0][0] < day:
+            heapq.heappop(heap)
+        if not heap:
+            break
+        if day != current_day:
+            current_day, day_str = day, ordinal_to_date(day)
+
+        key, i, task = heapq.heappop(heap)
+        start, end = block
+        length = end - start
+        if left[i] > 0:
+            length = min(length, max(left[i], task.min_block_minutes))
+            left[i] -= length
+            if left[i] > 0:
+                heapq.heappush(heap, (key, i, task))
+        priority = priorities.get(task.task_id, "high") if priorities else "high"
+        study_blocks.append(study_block(task, day_str, (start, start + length), priority))
+
+    return study_blocks
+
+
 def schedule_day(
-    tasks: List[Dict[str, Any]],
+    tasks: Sequence[Task],
     date_str: str,
     available_windows: List[Dict[str, str]],
     block_minutes: int = 45,
@@ -39,11 +596,7 @@ def schedule_day(
     Very simple scheduling function for one day.
 
     Args:
-        tasks: list of task dicts. Each task should have at least:
-               - task_id
-               - course_id
-               - title
-               - deadline_date (YYYY-MM-DD string)
+        tasks: Task records (deadline as a day ordinal), in any order.
         date_str: the target date for planning (YYYY-MM-DD).
         available_windows: list of {"start": "HH:MM", "end": "HH:MM"} for that date.
         block_minutes: length of each study block.
@@ -57,42 +610,85 @@ def schedule_day(
     if not tasks or not available_windows:
         return []
 
-    # Sort tasks by deadline (earliest first)
-    def _deadline_key(task: Dict[str, Any]) -> datetime:
-        return datetime.strptime(task["deadline_date"], "%Y-%m-%d")
+    # One-day timeline; schedule_range hands out blocks earliest deadline
+    # first and spreads each task's remaining effort over several blocks
+    day = date_to_ordinal(date_str)
+    blocks = available_blocks(available_windows, block_minutes, max_blocks_per_day)
+    sorted_tasks = sorted(tasks, key=lambda task: task.deadline)
+    return schedule_range(sorted_tasks, [(day, block) for block in blocks])
 
-    sorted_tasks = sorted(tasks, key=_deadline_key)
 
-    # Generate all available blocks for the day
-    all_blocks: List[Tuple[time, time]] = []
-    for window in available_windows:
-        start = _parse_time(window["start"])
-        end = _parse_time(window["end"])
-        all_blocks.extend(_split_into_blocks(start, end, block_minutes))
+# ---------- Batch preparation ----------
 
-    # Apply max_blocks_per_day limit
-    all_blocks = all_blocks[:max_blocks_per_day]
+# Helpers for planning many users at once (nightly precompute). Only the
+# steps that are plain arithmetic over every user's intervals are batched;
+# placement stays per user in `schedule_constrained`.
 
-    study_blocks: List[Dict[str, Any]] = []
-    block_idx = 0
 
-    for task in sorted_tasks:
-        if block_idx >= len(all_blocks):
-            break
+def batch_normalize(intervals_per_user: Sequence[Sequence[Interval]]) -> List[List[Interval]]:
+    """`normalize` for many users' interval lists in one NumPy pass."""
+    n_users = len(intervals_per_user)
+    result: List[List[Interval]] = [[] for _ in range(n_users)]
+    owner = np.repeat(np.arange(n_users), [len(intervals) for intervals in intervals_per_user])
+    bounds = np.array(
+        [interval for intervals in intervals_per_user for interval in intervals], dtype=np.int64
+    ).reshape(-1, 2)
+    start, end = bounds[:, 0], bounds[:, 1]
+    keep = start < end
+    owner, start, end = owner[keep], start[keep], end[keep]
+    if len(owner) == 0:
+        return result
 
-        block_start, block_end = all_blocks[block_idx]
-        block_idx += 1
-
-        study_blocks.append(
-            {
-                "date": date_str,
-                "start_time": block_start.strftime("%H:%M"),
-                "end_time": block_end.strftime("%H:%M"),
-                "task_id": task["task_id"],
-                "course_id": task["course_id"],
-                "title": task["title"],
-                "priority": "high",  # early deadlines are high priority
-            }
-        )
+    # Offsetting by owner keeps the running max of the end from leaking
+    # into the next user's intervals
+    order = np.lexsort((start, owner))
+    owner, start, end = owner[order], start[order], end[order]
+    stride = MINUTES_PER_DAY + 1
+    running_end = np.maximum.accumulate(owner * stride + end) - owner * stride
+    new_run = np.r_[True, (owner[1:] != owner[:-1]) | (start[1:] > running_end[:-1])]
+    firsts = np.flatnonzero(new_run)
+    merged_end = np.maximum.reduceat(end, firsts)
 
-    return study_blocks
+    for u, s, e in zip(owner[firsts].tolist(), start[firsts].tolist(), merged_end.tolist()):
+        result[u].append((s, e))
+    return result
+
+
+def batch_block_counts(
+    free_per_user: Sequence[Sequence[Interval]],
+    block_minutes: Sequence[int],
+    limits: Sequence[int],
+    gap_minutes: Sequence[int],
+    break_every: Sequence[int],
+    break_minutes: Sequence[int],
+) -> List[int]:
+    """
+    `len(extract_blocks(...))` for many users, one setting per user, in
+    closed form instead of cutting the blocks one by one.
+    """
+    n_users = len(free_per_user)
+    owner = np.repeat(np.arange(n_users), [len(free) for free in free_per_user])
+    bounds = np.array([interval for free in free_per_user for interval in free], dtype=np.int64).reshape(-1, 2)
+    b = np.asarray(block_minutes, dtype=np.int64)
+    if (b <= 0).any():
+        raise ValueError("block_minutes must be positive")
+    b = b[owner]
+    gap = np.asarray(gap_minutes, dtype=np.int64)[owner]
+    every = np.asarray(break_every, dtype=np.int64)[owner]
+    pause = np.asarray(break_minutes, dtype=np.int64)[owner]
+    length = bounds[:, 1] - bounds[:, 0]
+    step = b + gap
+
+    # Without breaks an interval of L minutes fits (L + gap) // (b + gap)
+    # blocks. With them, a full run of `every` blocks plus its break takes
+    # `cycle` minutes; count whole cycles, then the blocks of the rest.
+    plain = np.maximum(length + gap, 0) // step
+    runs = np.maximum(every, 1)
+    cycle = runs * b + (runs - 1) * gap + pause
+    whole = length // cycle
+    rest = length - whole * cycle
+    spaced = whole * runs + np.minimum(runs, (rest + gap) // step)
+    per_interval = np.where(every > 0, spaced, plain)
+
+    totals = np.bincount(owner, weights=per_interval, minlength=n_users).astype(np.int64)
+    return np.minimum(totals, np.asarray(limits, dtype=np.int64)).tolist()
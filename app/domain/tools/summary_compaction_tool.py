@@ -0,0 +1,130 @@
+# app/domain/tools/summary_compaction_tool.py
+
+"""
+Rolling compaction of a user's reflection history.
+
+`state["history"]` keeps only the last RECENT_HISTORY_ENTRIES raw entries.
+Everything older is folded into `state["history_summary"]`, a small
+JSON-friendly dict of fixed size:
+- aggregate counts over all entries (entries, completed / partial task
+  mentions, difficulty histogram, first / last date)
+- a digest of the most recent notes that left the raw window, each cut
+  to NOTE_DIGEST_CHARS
+
+`append_history` is applied for every `history_appended` journal event,
+so the summary is updated incrementally and replays identically. States
+written before compaction are summarised on their next reflection;
+`history_summary` builds a summary on the fly for reads until then.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from app.domain.memory.records import HistoryEntry, ordinal_to_date
+
+# Raw entries kept; must cover the planner's HISTORY_WINDOW.
+RECENT_HISTORY_ENTRIES = 30
+# Condensed notes of older entries kept in the digest, newest last.
+NOTES_DIGEST_SIZE = 10
+NOTE_DIGEST_CHARS = 120
+
+
+def new_summary() -> Dict[str, Any]:
+    """Summary of an empty history."""
+    return {
+        "entries": 0,
+        "first_date": None,     # day ordinals
+        "last_date": None,
+        "completed": 0,         # task ids reported completed, summed
+        "partial": 0,
+        "rating_counts": [0, 0, 0, 0, 0],  # difficulty 1..5
+        "notes_digest": [],     # [date ordinal, condensed notes]
+    }
+
+
+def append_history(state: Dict[str, Any], entry: HistoryEntry, keep: int = RECENT_HISTORY_ENTRIES) -> None:
+    """
+    Append `entry` to the raw history and the summary, folding the entry
+    that falls out of the raw window into the notes digest. In place.
+    """
+    history: List[HistoryEntry] = state["history"]
+    summary = state.get("history_summary")
+    if summary is None:
+        # State from before compaction: summarise what is there first
+        summary = state["history_summary"] = summarize(history, keep)
+        del history[:-keep]
+
+    _count(summary, entry)
+    history.append(entry)
+    while len(history) > keep:
+        _digest(summary, history.pop(0))
+
+
+def summarize(history: List[HistoryEntry], keep: int = RECENT_HISTORY_ENTRIES) -> Dict[str, Any]:
+    """
+    Summary of a full history from scratch; entries before the last
+    `keep` go into the notes digest.
+    """
+    summary = new_summary()
+    for entry in history:
+        _count(summary, entry)
+    for entry in history[:-keep] if keep > 0 else history:
+        _digest(summary, entry)
+    return summary
+
+
+def history_summary(state: Dict[str, Any]) -> Dict[str, Any]:
+    """The state's summary, or one built from the raw history (not stored)."""
+    summary = state.get("history_summary")
+    return summary if summary is not None else summarize(state["history"])
+
+
+def summary_view(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """The summary as shown in status payloads and LLM prompts."""
+    counts = summary["rating_counts"]
+    rated = sum(counts)
+    return {
+        "entries": summary["entries"],
+        "first_date": _date(summary["first_date"]),
+        "last_date": _date(summary["last_date"]),
+        "completed_task_reports": summary["completed"],
+        "partial_task_reports": summary["partial"],
+        "avg_difficulty": (
+            round(sum(r * n for r, n in enumerate(counts, start=1)) / rated, 2) if rated else None
+        ),
+        "difficulty_counts": {str(r): n for r, n in enumerate(counts, start=1)},
+        "notes_digest": [{"date": _date(day), "notes": text} for day, text in summary["notes_digest"]],
+    }
+
+
+# ---------- Internals ----------
+
+def _count(summary: Dict[str, Any], entry: HistoryEntry) -> None:
+    summary["entries"] += 1
+    if summary["first_date"] is None or entry.date < summary["first_date"]:
+        summary["first_date"] = entry.date
+    if summary["last_date"] is None or entry.date > summary["last_date"]:
+        summary["last_date"] = entry.date
+    summary["completed"] += len(entry.completed_task_ids)
+    summary["partial"] += len(entry.partial_task_ids)
+    rating = min(max(int(entry.difficulty_rating), 1), 5)
+    summary["rating_counts"][rating - 1] += 1
+
+
+def _digest(summary: Dict[str, Any], entry: HistoryEntry) -> None:
+    notes = _condense(entry.notes)
+    if not notes:
+        return
+    digest = summary["notes_digest"]
+    digest.append([entry.date, notes])
+    del digest[:-NOTES_DIGEST_SIZE]
+
+
+def _condense(notes: str) -> str:
+    text = " ".join(notes.split())
+    if len(text) > NOTE_DIGEST_CHARS:
+        text = text[: NOTE_DIGEST_CHARS - 1].rstrip() + "…"
+    return text
+
+
+def _date(day: Optional[int]) -> Optional[str]:
+    return ordinal_to_date(day) if day is not None else None
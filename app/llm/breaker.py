@@ -0,0 +1,116 @@
+# app/llm/breaker.py
+
+"""
+Circuit breaker for Gemini calls.
+
+While Gemini is failing or slow, waiting on it before falling back makes
+every request pay the full timeout. The breaker counts consecutive failed
+or slow calls; after `failure_threshold` of them it opens and callers go
+straight to their fallback text for `cooldown_seconds`. Then one probe
+call is let through (half-open): success closes the breaker, failure
+opens it for another cool-down.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the LLM while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker with half-open probing. Thread-safe.
+    """
+
+    def __init__(self, failure_threshold: int, slow_call_seconds: float, cooldown_seconds: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_call_seconds = slow_call_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0              # consecutive failed or slow calls
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "trips": 0}
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go to the LLM now."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                self._state = HALF_OPEN
+                self._probing = False
+            if self._state == HALF_OPEN and not self._probing:
+                # This caller is the probe; others keep falling back
+                self._probing = True
+            elif self._state != CLOSED:
+                self._stats["rejected"] += 1
+                raise CircuitOpenError(f"LLM circuit {self._state}")
+            self._stats["calls"] += 1
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            if self.slow_call_seconds > 0 and latency > self.slow_call_seconds:
+                self._stats["slow_calls"] += 1
+                self._failed()
+                return
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+            self._failed()
+
+    def abandon_call(self) -> None:
+        """A call ended without a verdict (its caller went away): let another probe through."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+
+    def _failed(self) -> None:
+        # Call with _lock held
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self._stats["trips"] += 1
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "state": self._state, "consecutive_failures": self._failures}
+
+
+_BREAKER: Optional[CircuitBreaker] = None
+_BREAKER_LOCK = threading.Lock()
+
+
+def get_llm_breaker() -> CircuitBreaker:
+    """The process-wide breaker, built from settings on first use."""
+    global _BREAKER
+    if _BREAKER is None:
+        with _BREAKER_LOCK:
+            if _BREAKER is None:
+                _BREAKER = CircuitBreaker(
+                    failure_threshold=settings.get_llm_breaker_failures(),
+                    slow_call_seconds=settings.get_llm_slow_call_seconds(),
+                    cooldown_seconds=settings.get_llm_breaker_cooldown(),
+                )
+    return _BREAKER
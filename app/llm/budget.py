@@ -0,0 +1,177 @@
+# app/llm/budget.py
+
+"""
+Prompt-size budgeting and token accounting for LLM calls.
+
+Token counts are estimated locally (about 4 characters per token for
+English text and JSON-ish data; counting with the API would cost a round
+trip). Before a prompt is sent, its variable-size inputs are trimmed
+until the estimate fits the prompt budget: trailing blocks are replaced
+by an "N more" note, and optional status fields are dropped in order of
+importance.
+
+`TokenMeter` records prompt / output tokens per endpoint (the kind of
+generation: plan_summary, plan_range_summary, reflection_feedback) and
+per user. It uses the API's usage metadata when the response carries it.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+CHARS_PER_TOKEN = 4
+# Users whose counters are kept; the least recently active are dropped.
+MAX_TRACKED_USERS = 10_000
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text`."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+# ---------- Trimming ----------
+
+def fit_items(
+    render: Callable[[Sequence[Any], int], str],
+    items: Sequence[Any],
+    budget: int,
+) -> Tuple[str, int]:
+    """
+    Render the longest prefix of `items` whose prompt fits `budget` tokens.
+    `render(kept, omitted)` builds the prompt from the kept items and the
+    number left out. Returns (prompt, omitted). If even no items do not
+    fit, the prompt without items is returned.
+    """
+    prompt = render(items, 0)
+    if budget <= 0 or estimate_tokens(prompt) <= budget:
+        return prompt, 0
+
+    # Prompt size grows with the prefix length: binary search it
+    lo, hi = 0, len(items) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(render(items[:mid], len(items) - mid)) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return render(items[:lo], len(items) - lo), len(items) - lo
+
+
+def fit_fields(
+    render: Callable[[Dict[str, Any]], str],
+    data: Dict[str, Any],
+    droppable: Sequence[str],
+    budget: int,
+) -> Tuple[str, List[str]]:
+    """
+    Render `data`, dropping keys in `droppable` order (least important
+    first) until the prompt fits `budget` tokens. Returns (prompt, dropped).
+    """
+    prompt = render(data)
+    dropped: List[str] = []
+    if budget <= 0:
+        return prompt, dropped
+    data = dict(data)
+    for key in droppable:
+        if estimate_tokens(prompt) <= budget:
+            break
+        if key in data:
+            del data[key]
+            dropped.append(key)
+            prompt = render(data)
+    return prompt, dropped
+
+
+# ---------- Accounting ----------
+
+def _counters() -> Dict[str, int]:
+    return {
+        "requests": 0,          # prompts built (cache hits included)
+        "llm_calls": 0,         # prompts actually sent to Gemini
+        "prompt_tokens": 0,
+        "output_tokens": 0,
+        "trimmed_prompts": 0,
+    }
+
+
+class TokenMeter:
+    """Per-endpoint and per-user token counters. Thread-safe."""
+
+    def __init__(self, max_users: int = MAX_TRACKED_USERS) -> None:
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, int]] = {}
+        self._users: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    def record_request(self, endpoint: str, user_id: Optional[str], trimmed: bool) -> None:
+        with self._lock:
+            for counters in self._targets(endpoint, user_id):
+                counters["requests"] += 1
+                counters["trimmed_prompts"] += int(trimmed)
+
+    def record_call(self, endpoint: str, user_id: Optional[str], prompt_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            for counters in self._targets(endpoint, user_id):
+                counters["llm_calls"] += 1
+                counters["prompt_tokens"] += prompt_tokens
+                counters["output_tokens"] += output_tokens
+
+    def add(self, endpoint: str, user_id: Optional[str], counters: Dict[str, int]) -> None:
+        """Add counters recorded by another meter (e.g. in a worker process)."""
+        with self._lock:
+            for target in self._targets(endpoint, user_id):
+                for name, count in counters.items():
+                    target[name] += count
+
+    def _targets(self, endpoint: str, user_id: Optional[str]) -> List[Dict[str, int]]:
+        # Call with _lock held
+        targets = [self._endpoints.setdefault(endpoint, _counters())]
+        if user_id is not None:
+            user = self._users.get(user_id)
+            if user is None:
+                user = self._users[user_id] = _counters()
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            targets.append(user)
+        return targets
+
+    def user_stats(self, user_id: str) -> Optional[Dict[str, int]]:
+        with self._lock:
+            counters = self._users.get(user_id)
+            return dict(counters) if counters is not None else None
+
+    def stats(self, top_users: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {name: dict(c) for name, c in self._endpoints.items()}
+            heaviest = sorted(
+                self._users.items(),
+                key=lambda item: item[1]["prompt_tokens"] + item[1]["output_tokens"],
+                reverse=True,
+            )[:top_users]
+            return {
+                "prompt_token_budget": settings.get_llm_prompt_token_budget(),
+                "max_output_tokens": settings.get_llm_max_output_tokens(),
+                "endpoints": endpoints,
+                "tracked_users": len(self._users),
+                "top_users": [{"user_id": uid, **dict(c)} for uid, c in heaviest],
+            }
+
+
+def usage_tokens(response: Any, prompt: str, text: str) -> Tuple[int, int]:
+    """(prompt, output) tokens of a response: from usage metadata if present, else estimated."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    if not isinstance(prompt_tokens, int):
+        prompt_tokens = estimate_tokens(prompt)
+    if not isinstance(output_tokens, int):
+        output_tokens = estimate_tokens(text)
+    return prompt_tokens, output_tokens
+
+
+TOKEN_METER = TokenMeter()
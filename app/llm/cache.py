@@ -0,0 +1,266 @@
+# app/llm/cache.py
+
+"""
+Content-addressed cache for LLM responses.
+
+Responses are keyed by a hash of the model name and the rendered prompt,
+so an identical prompt (a re-submitted plan, an unchanged day re-planned)
+is answered without calling Gemini. Entries expire after a TTL. The
+memory tier is LRU-evicted under a byte budget; an optional disk tier
+keeps responses across restarts.
+
+Only successful LLM responses are cached, never fallback text.
+
+`SingleFlight` coalesces concurrent identical calls: while one caller is
+waiting on Gemini for a key, others with the same key wait for that call
+and share its result (or error) instead of issuing their own.
+`AsyncSingleFlight` does the same for coroutines on one event loop.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.common.lru import LRUCache
+from app.config import settings
+
+
+class LLMResponseCache:
+    """
+    Two-tier (memory, then optional disk) response cache with hit/miss
+    counters. Thread-safe.
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: int = 0, disk_dir: Optional[str] = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir or None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        self._memory: LRUCache[Dict[str, Any]] = LRUCache(max_bytes=max_bytes)
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+            "saved_llm_seconds": 0.0,
+        }
+
+    @staticmethod
+    def key(model_name: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    # ---------- Lookups ----------
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached response text, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            tier = "memory_hits"
+            if entry is not None and entry["expires_at"] <= now:
+                self._memory.discard(key)
+                self._stats["expired"] += 1
+                entry = None
+
+        if entry is None and self.disk_dir:
+            entry = self._read_disk(key, now)
+            tier = "disk_hits"
+            if entry is not None:
+                with self._lock:
+                    self._insert(key, entry)
+
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats[tier] += 1
+            self._stats["saved_llm_seconds"] += entry["latency"]
+            return entry["text"]
+
+    def put(self, key: str, text: str, latency: float = 0.0) -> None:
+        """Store a response; `latency` is what the LLM call took (seconds)."""
+        entry = {"text": text, "expires_at": time.time() + self.ttl_seconds, "latency": latency}
+        with self._lock:
+            self._insert(key, entry)
+            self._stats["stores"] += 1
+        if self.disk_dir:
+            self._write_disk(key, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["saved_llm_seconds"] = round(stats["saved_llm_seconds"], 3)
+            stats["entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory.total_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["enabled"] = True
+        stats["disk_tier"] = bool(self.disk_dir)
+        return stats
+
+    def clear(self) -> None:
+        """Drop the memory tier (the disk tier expires on its own)."""
+        with self._lock:
+            for key in self._memory.keys():
+                self._memory.discard(key)
+
+    # ---------- Internals ----------
+
+    def _insert(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory.put(key, entry, len(entry["text"].encode("utf-8")))
+        # Never evict the entry just inserted, even if it alone is over budget
+        for victim in self._memory.eviction_candidates():
+            if not self._memory.over_budget() or victim == key:
+                break
+            self._memory.discard(victim)
+            self._stats["evictions"] += 1
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + ".json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) <= now:
+            with self._lock:
+                self._stats["expired"] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError:
+            # The disk tier is best effort
+            pass
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call
+    for their key is in flight block until it finishes and get the same
+    result, or the same exception re-raised. Thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                flight.result = fn()
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._flights)}
+
+
+class AsyncSingleFlight:
+    """
+    `SingleFlight` for coroutines. The call runs as its own task, so a
+    cancelled caller (e.g. a client disconnect) does not cancel it for the
+    others still waiting. Not thread-safe: use from one event loop.
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, asyncio.Future] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda f: self._finished(key, f))
+            self._stats["calls"] += 1
+        else:
+            self._stats["coalesced"] += 1
+        return await asyncio.shield(flight)
+
+    def _finished(self, key: str, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the error retrieved even if every caller was cancelled
+        if not flight.cancelled():
+            flight.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "in_flight": len(self._flights)}
+
+
+_CACHE: Optional[LLMResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """The process-wide cache, built from settings on first use; None if disabled (TTL 0)."""
+    global _CACHE
+    if _CACHE is None:
+        ttl = settings.get_llm_cache_ttl()
+        if ttl <= 0:
+            return None
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = LLMResponseCache(
+                    ttl_seconds=ttl,
+                    max_bytes=settings.get_llm_cache_max_bytes(),
+                    disk_dir=settings.get_llm_cache_dir(),
+                )
+    return _CACHE
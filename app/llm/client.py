@@ -1,14 +1,65 @@
 # app/llm/client.py
 
-import google.generativeai as genai
+"""
+Gemini client registry.
+
+The SDK is imported and configured on the first LLM call, not at import
+time, so the API and offline jobs start without loading it (or needing
+GEMINI_API_KEY) until text is actually generated. One GenerativeModel is
+created per model name and reused by every request, which also reuses
+its underlying connection.
+"""
+
+import os
+import threading
+from typing import Any, Dict
+
 from app.config.settings import get_gemini_api_key
 
-# Configure Gemini once, using key from .env / environment
-genai.configure(api_key=get_gemini_api_key())
+DEFAULT_MODEL = "models/gemini-2.5-flash"
+
+_LOCK = threading.Lock()
+_GENAI: Any = None                 # the configured google.generativeai module
+_MODELS: Dict[str, Any] = {}       # model name -> GenerativeModel
+
+
+def _genai() -> Any:
+    """Import and configure the SDK once. Call with _LOCK held."""
+    global _GENAI
+    if _GENAI is None:
+        import google.generativeai as genai
 
-def get_llm_client(model_name: str = "models/gemini-2.5-flash"):
+        # Configure Gemini once, using key from .env / environment
+        genai.configure(api_key=get_gemini_api_key())
+        _GENAI = genai
+    return _GENAI
+
+
+def get_llm_client(model_name: str = DEFAULT_MODEL):
     """
-    Returns a configured Gemini GenerativeModel instance.
+    Returns the shared, configured Gemini GenerativeModel for `model_name`,
+    creating it on first use. Thread-safe.
     Default model: models/gemini-2.5-flash
     """
-    return genai.GenerativeModel(model_name)
+    model = _MODELS.get(model_name)
+    if model is None:
+        with _LOCK:
+            model = _MODELS.get(model_name)
+            if model is None:
+                model = _genai().GenerativeModel(model_name)
+                _MODELS[model_name] = model
+    return model
+
+
+def reset_llm_clients() -> None:
+    """Drop all cached models; the next call creates fresh ones."""
+    global _LOCK
+    _MODELS.clear()
+    # A lock held by another thread at fork time would never be released
+    _LOCK = threading.Lock()
+
+
+# Connections are not fork-safe: forked workers (e.g. the precompute
+# pool) build their own clients.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_llm_clients)
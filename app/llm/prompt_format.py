@@ -0,0 +1,101 @@
+# app/llm/prompt_format.py
+
+"""
+Canonical, compact text for the data embedded in prompts.
+
+Prompts used to embed `str()` of lists of dicts, which repeats every key
+on every row and depends on dict construction order. Here:
+- lists of records become a table: one header row, one row per record,
+  columns in a fixed order; a column with the same value in every row is
+  written once above the table instead
+- mappings become "key: value" lines with keys sorted (nested mappings
+  indented), lists of scalars are comma-joined
+
+Identical inputs therefore give byte-identical prompts, which keeps the
+response cache effective.
+"""
+
+from typing import Any, List, Mapping, Optional, Sequence
+
+# Block columns sent to the LLM, in order (task ids mean nothing to it).
+BLOCK_COLUMNS = ("date", "start_time", "end_time", "course_id", "title", "priority")
+HISTORY_ENTRY_KEYS = ("date", "completed_task_ids", "partial_task_ids", "difficulty_rating", "notes")
+
+
+def format_blocks(blocks: Sequence[Mapping[str, Any]], omitted: int = 0) -> str:
+    """Planned blocks as a table; `omitted` blocks cut for the token budget are noted."""
+    text = format_table(blocks, BLOCK_COLUMNS)
+    if omitted:
+        text += f"\n(+{omitted} more blocks)"
+    return text
+
+
+def format_history_entry(entry: Mapping[str, Any]) -> str:
+    """One reflection entry, known keys first in a fixed order."""
+    return format_mapping(entry, order=HISTORY_ENTRY_KEYS)
+
+
+def format_table(rows: Sequence[Mapping[str, Any]], columns: Optional[Sequence[str]] = None) -> str:
+    """
+    Records as "a | b | c" rows under a header. Columns default to the
+    sorted union of keys. Columns constant across all rows (2+) are
+    hoisted above the table as "key: value".
+    """
+    if not rows:
+        return "(none)"
+    if columns is None:
+        columns = sorted({key for row in rows for key in row})
+
+    constant: List[str] = []
+    varying: List[str] = []
+    for column in columns:
+        values = {_scalar(row.get(column)) for row in rows}
+        (constant if len(rows) > 1 and len(values) == 1 else varying).append(column)
+
+    lines = [f"{column}: {_scalar(rows[0].get(column))}" for column in constant]
+    if varying:
+        lines.append(" | ".join(varying))
+        lines.extend(" | ".join(_cell(row.get(column)) for column in varying) for row in rows)
+    return "\n".join(lines)
+
+
+def format_mapping(data: Mapping[str, Any], order: Sequence[str] = (), indent: str = "") -> str:
+    """
+    "key: value" lines; keys in `order` first, the rest sorted. Nested
+    mappings are indented, lists of mappings become tables.
+    """
+    keys = [k for k in order if k in data] + sorted(k for k in data if k not in order)
+    lines = []
+    for key in keys:
+        value = data[key]
+        if isinstance(value, Mapping):
+            lines.append(f"{indent}{key}:")
+            lines.append(format_mapping(value, indent=indent + "  ") if value else f"{indent}  (none)")
+        elif isinstance(value, (list, tuple)) and any(isinstance(v, Mapping) for v in value):
+            table = format_table([v for v in value if isinstance(v, Mapping)])
+            lines.append(f"{indent}{key}:")
+            lines.extend(f"{indent}  {line}" for line in table.split("\n"))
+        else:
+            lines.append(f"{indent}{key}: {_scalar(value)}")
+    return "\n".join(lines)
+
+
+def _scalar(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float):
+        # Stable, short floats (0.5 not 0.5000000001)
+        return format(round(value, 4), "g")
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value, key=str) if isinstance(value, (set, frozenset)) else value
+        return ", ".join(_scalar(v) for v in items) if items else "-"
+    if isinstance(value, Mapping):
+        return ", ".join(f"{k}={_scalar(value[k])}" for k in sorted(value))
+    # One line per value; newlines would break the layout
+    return " ".join(str(value).split())
+
+
+def _cell(value: Any) -> str:
+    return _scalar(value).replace("|", "/")
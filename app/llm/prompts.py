@@ -1,6 +1,43 @@
 # app/llm/prompts.py
 
-PLAN_SUMMARY_TEMPLATE = """
+"""
+Prompt templates, parsed once at import.
+
+`PromptTemplate.format` joins the pre-split literal parts with the
+values, instead of re-parsing the template string on every call. Data
+placed in `{blocks}`, `{history_entry}` and `{status}` is rendered by
+app.llm.prompt_format.
+"""
+
+from string import Formatter
+from typing import List, Optional, Tuple
+
+
+class PromptTemplate:
+    """A template with plain `{name}` fields (no format specs or conversions)."""
+
+    def __init__(self, template: str) -> None:
+        self.template = template
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if spec or conversion:
+                raise ValueError(f"Unsupported field '{{{field}!{conversion}:{spec}}}' in prompt template")
+            self._parts.append((literal, field))
+        self.fields = frozenset(field for _, field in self._parts if field is not None)
+
+    def format(self, **values: object) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Missing prompt fields: {sorted(missing)}")
+        out: List[str] = []
+        for literal, field in self._parts:
+            out.append(literal)
+            if field is not None:
+                out.append(str(values[field]))
+        return "".join(out)
+
+
+PLAN_SUMMARY_TEMPLATE = PromptTemplate("""
 You are a helpful university study assistant.
 Generate a short, motivating summary of today's study plan
 based on the student's profile and planned blocks.
@@ -8,22 +45,37 @@ based on the student's profile and planned blocks.
 Profile summary:
 {profile_summary}
 
-Planned blocks (JSON-like):
+Planned blocks (table; shared values listed above it):
 {blocks}
 
 Respond in 3–5 sentences, simple and encouraging.
-"""
+""")
+
+PLAN_RANGE_SUMMARY_TEMPLATE = PromptTemplate("""
+You are a helpful university study assistant.
+Generate a short, motivating summary of the student's study plan
+from {start_date} to {end_date}, based on their profile and planned blocks.
+
+Profile summary:
+{profile_summary}
+
+Planned blocks (table; shared values listed above it):
+{blocks}
 
-REFLECTION_FEEDBACK_TEMPLATE = """
+Respond in 3–6 sentences, simple and encouraging. Mention how the work is
+spread over the days.
+""")
+
+REFLECTION_FEEDBACK_TEMPLATE = PromptTemplate("""
 You are a friendly study coach.
 Based on the reflection and current status, generate personalized feedback.
 
-Reflection entry (JSON-like):
+Reflection entry:
 {history_entry}
 
-Current status (JSON-like):
+Current status:
 {status}
 
 Give clear feedback in 3–5 sentences.
 Encourage the user and give 1–2 concrete tips for improvement.
-"""
+""")
@@ -1,96 +1,509 @@
 # app/llm/tools.py
 
-from typing import Any, Dict, List
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
 
-from app.llm.client import get_llm_client
-from app.llm.prompts import PLAN_SUMMARY_TEMPLATE, REFLECTION_FEEDBACK_TEMPLATE
+from app.config.settings import (
+    get_llm_max_output_tokens,
+    get_llm_prompt_token_budget,
+    get_llm_timeout,
+)
+from app.llm.breaker import CircuitOpenError, get_llm_breaker
+from app.llm.budget import (
+    CHARS_PER_TOKEN,
+    TOKEN_METER,
+    estimate_tokens,
+    fit_fields,
+    fit_items,
+    usage_tokens,
+)
+from app.llm.cache import AsyncSingleFlight, LLMResponseCache, SingleFlight, get_response_cache
+from app.llm.client import DEFAULT_MODEL, get_llm_client
+from app.llm.prompt_format import format_blocks, format_history_entry, format_mapping
+from app.llm.prompts import (
+    PLAN_RANGE_SUMMARY_TEMPLATE,
+    PLAN_SUMMARY_TEMPLATE,
+    REFLECTION_FEEDBACK_TEMPLATE,
+)
+
+
+# Identical prompts in flight at the same time share one Gemini call
+_FLIGHTS = SingleFlight()
+_ASYNC_FLIGHTS = AsyncSingleFlight()
+
+# Endpoint labels for token accounting (one per kind of generation)
+PLAN_SUMMARY = "plan_summary"
+PLAN_RANGE_SUMMARY = "plan_range_summary"
+REFLECTION_FEEDBACK = "reflection_feedback"
+
+# Status fields dropped, in this order, when a feedback prompt is over budget
+STATUS_DROP_ORDER = ("session", "profile", "status_counts", "history_summary")
+
+
+class EmptyResponseError(RuntimeError):
+    """The LLM answered without any text (e.g. all output went to thinking)."""
 
 
 def _safe_text(response) -> str:
     """
-    Safely extract model text output across Gemini APIs.
+    Safely extract model text output across Gemini APIs. Raises
+    EmptyResponseError if there is none, so callers fall back and
+    nothing is cached.
     """
+    text = ""
     try:
         if hasattr(response, "text") and response.text:
-            return response.text.strip()
-        if isinstance(response, dict) and "text" in response:
-            return response["text"].strip()
+            text = response.text.strip()
+        elif isinstance(response, dict) and "text" in response:
+            text = response["text"].strip()
     except Exception:
+        # .text raises when the response has no text parts
         pass
 
-    return str(response)
+    if not text:
+        raise EmptyResponseError("LLM response has no text")
+    return text
+
+
+def _generate(prompt: str, endpoint: str, user_id: Optional[str] = None, model_name: str = DEFAULT_MODEL) -> str:
+    """
+    Gemini text for a rendered prompt, served from the response cache when
+    the same model + prompt was answered recently. Concurrent identical
+    calls share one LLM request. Raises if the LLM call fails (callers
+    fall back); failures are never cached.
+    """
+    key = LLMResponseCache.key(model_name, prompt)
+    return _FLIGHTS.do(key, lambda: _cached_generate(key, prompt, model_name, endpoint, user_id))
+
+
+def _generation_config() -> Dict[str, Any]:
+    # Optional cap on output length (and with it cost and latency)
+    max_output_tokens = get_llm_max_output_tokens()
+    return {"max_output_tokens": max_output_tokens} if max_output_tokens > 0 else {}
+
+
+def _cached_generate(key: str, prompt: str, model_name: str, endpoint: str, user_id: Optional[str]) -> str:
+    # Checked inside the flight, so a caller that just missed a finishing
+    # call still finds its cached result
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    # Open breaker: fail fast into the caller's fallback
+    breaker = get_llm_breaker()
+    breaker.before_call()
+    timeout = get_llm_timeout()
+    started = time.perf_counter()
+    try:
+        model = get_llm_client(model_name)
+        response = model.generate_content(
+            prompt, generation_config=_generation_config(), request_options={"timeout": timeout}
+        )
+        text = _safe_text(response)
+    except BaseException:
+        breaker.record_failure()
+        TOKEN_METER.record_call(endpoint, user_id, estimate_tokens(prompt), 0)
+        raise
+    latency = time.perf_counter() - started
+    breaker.record_success(latency)
+    TOKEN_METER.record_call(endpoint, user_id, *usage_tokens(response, prompt, text))
+
+    if cache is not None:
+        cache.put(key, text, latency)
+    return text
+
+
+async def _generate_async(
+    prompt: str, endpoint: str, user_id: Optional[str] = None, model_name: str = DEFAULT_MODEL
+) -> str:
+    """
+    `_generate` without blocking a thread: awaits the SDK's async call, so
+    the event loop serves other requests during the round trip.
+    """
+    key = LLMResponseCache.key(model_name, prompt)
+    return await _ASYNC_FLIGHTS.do(
+        key, lambda: _cached_generate_async(key, prompt, model_name, endpoint, user_id)
+    )
+
+
+async def _cached_generate_async(
+    key: str, prompt: str, model_name: str, endpoint: str, user_id: Optional[str]
+) -> str:
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    breaker = get_llm_breaker()
+    breaker.before_call()
+    timeout = get_llm_timeout()
+    started = time.perf_counter()
+    try:
+        model = get_llm_client(model_name)
+        # wait_for enforces the deadline even if the SDK overruns its own
+        response = await asyncio.wait_for(
+            model.generate_content_async(
+                prompt, generation_config=_generation_config(), request_options={"timeout": timeout}
+            ),
+            timeout,
+        )
+        text = _safe_text(response)
+    except BaseException:
+        breaker.record_failure()
+        TOKEN_METER.record_call(endpoint, user_id, estimate_tokens(prompt), 0)
+        raise
+    latency = time.perf_counter() - started
+    breaker.record_success(latency)
+    TOKEN_METER.record_call(endpoint, user_id, *usage_tokens(response, prompt, text))
+
+    if cache is not None:
+        cache.put(key, text, latency)
+    return text
+
+
+async def _stream_generate(
+    prompt: str,
+    fallback: Callable[[Exception], str],
+    endpoint: str,
+    user_id: Optional[str] = None,
+    model_name: str = DEFAULT_MODEL,
+) -> AsyncIterator[str]:
+    """
+    Gemini text for a prompt, yielded piece by piece as it is generated.
+    A cached response comes as one piece and a completed stream is cached.
+    If the call fails before any text, `fallback(error)` is yielded
+    instead; a stream cut off midway ends with a short note. Streams are
+    not coalesced: each caller gets its own.
+    """
+    key = LLMResponseCache.key(model_name, prompt)
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    breaker = get_llm_breaker()
+    try:
+        breaker.before_call()
+    except CircuitOpenError as e:
+        yield fallback(e)
+        return
+
+    timeout = get_llm_timeout()
+    started = time.perf_counter()
+    first_latency = None
+    parts: List[str] = []
+    chunk = None
+    try:
+        model = get_llm_client(model_name)
+        response = await asyncio.wait_for(
+            model.generate_content_async(
+                prompt,
+                stream=True,
+                generation_config=_generation_config(),
+                request_options={"timeout": timeout},
+            ),
+            timeout,
+        )
+        chunks = response.__aiter__()
+        while True:
+            # The deadline bounds each wait for the next chunk, not the whole text
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                break
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            if first_latency is None:
+                first_latency = time.perf_counter() - started
+            parts.append(text)
+            yield text
+    except (GeneratorExit, asyncio.CancelledError):
+        # The client went away; says nothing about Gemini's health
+        breaker.abandon_call()
+        TOKEN_METER.record_call(endpoint, user_id, estimate_tokens(prompt), estimate_tokens("".join(parts)))
+        raise
+    except Exception as e:
+        breaker.record_failure()
+        TOKEN_METER.record_call(endpoint, user_id, estimate_tokens(prompt), estimate_tokens("".join(parts)))
+        yield f"\n\n(LLM stream interrupted: {type(e).__name__})" if parts else fallback(e)
+        return
+
+    latency = time.perf_counter() - started
+    # The last chunk of a stream carries the usage totals
+    TOKEN_METER.record_call(endpoint, user_id, *usage_tokens(chunk, prompt, "".join(parts)))
+    text = "".join(parts).strip()
+    if not text:
+        # A stream without text is a failed call, like in _safe_text
+        breaker.record_failure()
+        yield fallback(EmptyResponseError("LLM response has no text"))
+        return
+    breaker.record_success(first_latency if first_latency is not None else latency)
+    if cache is not None:
+        cache.put(key, text, latency)
+
+
+def _chunk_text(chunk) -> str:
+    # A chunk without text parts (e.g. only a finish reason) raises on .text
+    try:
+        return chunk.text or ""
+    except Exception:
+        return ""
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    """Counters of the response cache, request coalescing and circuit breaker."""
+    cache = get_response_cache()
+    stats = cache.stats() if cache is not None else {"enabled": False}
+    sync_flights, async_flights = _FLIGHTS.stats(), _ASYNC_FLIGHTS.stats()
+    stats["single_flight"] = {k: sync_flights[k] + async_flights[k] for k in sync_flights}
+    stats["breaker"] = get_llm_breaker().stats()
+    return stats
+
+
+def llm_usage_stats(user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Token counters: all endpoints and the heaviest users, or one user's (None if unseen)."""
+    if user_id is not None:
+        return TOKEN_METER.user_stats(user_id)
+    return TOKEN_METER.stats()
 
 
 # ----------------------------------------------------------
 #   PLAN SUMMARY — With LLM + fallback
 # ----------------------------------------------------------
 
-def generate_plan_summary(profile_summary: str, blocks: List[Dict[str, Any]]) -> str:
+def _plan_summary_prompt(profile_summary: str, blocks: List[Dict[str, Any]], user_id: Optional[str]) -> str:
+    # Format prompt using your custom template file
+    def render(kept: Sequence[Dict[str, Any]], omitted: int) -> str:
+        return PLAN_SUMMARY_TEMPLATE.format(
+            profile_summary=profile_summary,
+            blocks=format_blocks(kept, omitted),
+        )
+
+    prompt, omitted = fit_items(render, blocks, get_llm_prompt_token_budget())
+    TOKEN_METER.record_request(PLAN_SUMMARY, user_id, trimmed=omitted > 0)
+    return prompt
+
+
+def _block_lines(blocks: List[Dict[str, Any]]) -> str:
+    return "\n".join(
+        f"- {b['date']} {b['start_time']}-{b['end_time']} | {b['title']} ({b['course_id']})"
+        for b in blocks
+    )
+
+
+def _plan_summary_fallback(profile_summary: str, blocks: List[Dict[str, Any]], e: Exception) -> str:
+    # Safe fallback – never break planning
+    return (
+        "Plan summary (Fallback Mode):\n"
+        f"{profile_summary}\n\n"
+        "Today's blocks:\n"
+        f"{_block_lines(blocks)}\n\n"
+        f"(LLM failed: {type(e).__name__})"
+    )
+
+
+def generate_plan_summary(profile_summary: str,
+                          blocks: List[Dict[str, Any]],
+                          user_id: Optional[str] = None) -> str:
     """
     Return a natural-language summary of the plan for the day.
     Uses Gemini 2.5 if available; uses rule-based fallback otherwise.
+    `user_id` only attributes the tokens spent.
     """
     try:
-        model = get_llm_client()
+        return _generate(_plan_summary_prompt(profile_summary, blocks, user_id), PLAN_SUMMARY, user_id)
+    except Exception as e:
+        return _plan_summary_fallback(profile_summary, blocks, e)
+
+
+async def generate_plan_summary_async(profile_summary: str,
+                                      blocks: List[Dict[str, Any]],
+                                      user_id: Optional[str] = None) -> str:
+    """
+    Async `generate_plan_summary`.
+    """
+    try:
+        return await _generate_async(
+            _plan_summary_prompt(profile_summary, blocks, user_id), PLAN_SUMMARY, user_id
+        )
+    except Exception as e:
+        return _plan_summary_fallback(profile_summary, blocks, e)
+
 
-        # Format prompt using your custom template file
-        prompt = PLAN_SUMMARY_TEMPLATE.format(
+def stream_plan_summary(profile_summary: str,
+                        blocks: List[Dict[str, Any]],
+                        user_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streaming `generate_plan_summary`: yields the summary text as Gemini
+    produces it (or the fallback text in one piece).
+    """
+    return _stream_generate(
+        _plan_summary_prompt(profile_summary, blocks, user_id),
+        lambda e: _plan_summary_fallback(profile_summary, blocks, e),
+        PLAN_SUMMARY,
+        user_id,
+    )
+
+
+# ----------------------------------------------------------
+#   PLAN RANGE SUMMARY — With LLM + fallback
+# ----------------------------------------------------------
+
+def _plan_range_prompt(profile_summary: str,
+                       blocks: List[Dict[str, Any]],
+                       start_date: str,
+                       end_date: str,
+                       user_id: Optional[str]) -> str:
+    def render(kept: Sequence[Dict[str, Any]], omitted: int) -> str:
+        return PLAN_RANGE_SUMMARY_TEMPLATE.format(
             profile_summary=profile_summary,
-            blocks=blocks,
+            blocks=format_blocks(kept, omitted),
+            start_date=start_date,
+            end_date=end_date,
         )
 
-        response = model.generate_content(prompt)
-        return _safe_text(response)
+    prompt, omitted = fit_items(render, blocks, get_llm_prompt_token_budget())
+    TOKEN_METER.record_request(PLAN_RANGE_SUMMARY, user_id, trimmed=omitted > 0)
+    return prompt
 
-    except Exception as e:
-        # Safe fallback – never break planning
-        block_lines = "\n".join(
-            f"- {b['date']} {b['start_time']}-{b['end_time']} | {b['title']} ({b['course_id']})"
-            for b in blocks
+
+def _plan_range_fallback(profile_summary: str,
+                         blocks: List[Dict[str, Any]],
+                         start_date: str,
+                         end_date: str,
+                         e: Exception) -> str:
+    # Safe fallback – never break planning
+    return (
+        "Plan summary (Fallback Mode):\n"
+        f"{profile_summary}\n\n"
+        f"Blocks from {start_date} to {end_date}:\n"
+        f"{_block_lines(blocks)}\n\n"
+        f"(LLM failed: {type(e).__name__})"
+    )
+
+
+def generate_plan_range_summary(profile_summary: str,
+                                blocks: List[Dict[str, Any]],
+                                start_date: str,
+                                end_date: str,
+                                user_id: Optional[str] = None) -> str:
+    """
+    Return one natural-language summary for a multi-day plan.
+    Uses Gemini 2.5 if available; uses rule-based fallback otherwise.
+    """
+    try:
+        return _generate(
+            _plan_range_prompt(profile_summary, blocks, start_date, end_date, user_id),
+            PLAN_RANGE_SUMMARY,
+            user_id,
         )
+    except Exception as e:
+        return _plan_range_fallback(profile_summary, blocks, start_date, end_date, e)
+
 
-        return (
-            "Plan summary (Fallback Mode):\n"
-            f"{profile_summary}\n\n"
-            "Today's blocks:\n"
-            f"{block_lines}\n\n"
-            f"(LLM failed: {type(e).__name__})"
+async def generate_plan_range_summary_async(profile_summary: str,
+                                            blocks: List[Dict[str, Any]],
+                                            start_date: str,
+                                            end_date: str,
+                                            user_id: Optional[str] = None) -> str:
+    """
+    Async `generate_plan_range_summary`.
+    """
+    try:
+        return await _generate_async(
+            _plan_range_prompt(profile_summary, blocks, start_date, end_date, user_id),
+            PLAN_RANGE_SUMMARY,
+            user_id,
         )
+    except Exception as e:
+        return _plan_range_fallback(profile_summary, blocks, start_date, end_date, e)
 
 
 # ----------------------------------------------------------
 #   REFLECTION FEEDBACK — With LLM + fallback
 # ----------------------------------------------------------
 
+def _reflection_prompt(history_entry: Dict[str, Any], status: Dict[str, Any], user_id: Optional[str]) -> str:
+    budget = get_llm_prompt_token_budget()
+
+    # Fill reflection template
+    def render(status: Dict[str, Any]) -> str:
+        return REFLECTION_FEEDBACK_TEMPLATE.format(
+            history_entry=format_history_entry(history_entry),
+            status=format_mapping(status),
+        )
+
+    prompt, dropped = fit_fields(render, status, STATUS_DROP_ORDER, budget)
+    over = estimate_tokens(prompt) - budget if budget > 0 else 0
+    notes = history_entry.get("notes") or ""
+    if over > 0 and notes:
+        # Free-text notes are the last thing left to shorten
+        keep = max(len(notes) - over * CHARS_PER_TOKEN - 3, 0)
+        history_entry = {**history_entry, "notes": notes[:keep] + "..."}
+        prompt = render({k: v for k, v in status.items() if k not in dropped})
+    TOKEN_METER.record_request(REFLECTION_FEEDBACK, user_id, trimmed=bool(dropped) or over > 0)
+    return prompt
+
+
+def _reflection_fallback(history_entry: Dict[str, Any], e: Exception) -> str:
+    # Extract fields safely
+    completed = len(history_entry.get("completed_task_ids", []))
+    partial = len(history_entry.get("partial_task_ids", []))
+    diff = history_entry.get("difficulty_rating", "?")
+
+    return (
+        "Reflection feedback (Fallback Mode):\n"
+        f"- Completed: {completed}, Partial: {partial}\n"
+        f"- Difficulty: {diff}/5\n"
+        "Try to start with the hardest topic next time, "
+        "take small breaks, and keep building consistency.\n"
+        f"(LLM failed: {type(e).__name__})"
+    )
+
+
 def generate_reflection_feedback(history_entry: Dict[str, Any],
-                                 status: Dict[str, Any]) -> str:
+                                 status: Dict[str, Any],
+                                 user_id: Optional[str] = None) -> str:
     """
     Generate supportive reflection feedback using Gemini.
     Falls back to a friendly, rule-based version if LLM call fails.
     """
     try:
-        model = get_llm_client()
+        return _generate(_reflection_prompt(history_entry, status, user_id), REFLECTION_FEEDBACK, user_id)
+    except Exception as e:
+        return _reflection_fallback(history_entry, e)
 
-        # Fill reflection template
-        prompt = REFLECTION_FEEDBACK_TEMPLATE.format(
-            history_entry=history_entry,
-            status=status,
+
+async def generate_reflection_feedback_async(history_entry: Dict[str, Any],
+                                             status: Dict[str, Any],
+                                             user_id: Optional[str] = None) -> str:
+    """
+    Async `generate_reflection_feedback`.
+    """
+    try:
+        return await _generate_async(
+            _reflection_prompt(history_entry, status, user_id), REFLECTION_FEEDBACK, user_id
         )
+    except Exception as e:
+        return _reflection_fallback(history_entry, e)
 
-        response = model.generate_content(prompt)
-        return _safe_text(response)
 
-    except Exception as e:
-        # Extract fields safely
-        completed = len(history_entry.get("completed_task_ids", []))
-        partial = len(history_entry.get("partial_task_ids", []))
-        diff = history_entry.get("difficulty_rating", "?")
-
-        return (
-            "Reflection feedback (Fallback Mode):\n"
-            f"- Completed: {completed}, Partial: {partial}\n"
-            f"- Difficulty: {diff}/5\n"
-            "Try to start with the hardest topic next time, "
-            "take small breaks, and keep building consistency.\n"
-            f"(LLM failed: {type(e).__name__})"
-        )
+def stream_reflection_feedback(history_entry: Dict[str, Any],
+                               status: Dict[str, Any],
+                               user_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streaming `generate_reflection_feedback`.
+    """
+    return _stream_generate(
+        _reflection_prompt(history_entry, status, user_id),
+        lambda e: _reflection_fallback(history_entry, e),
+        REFLECTION_FEEDBACK,
+        user_id,
+    )
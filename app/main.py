@@ -0,0 +1,221 @@
+# app/main.py
+
+"""
+Offline jobs.
+
+    python -m app.main precompute [--date YYYY-MM-DD] [--processes N]
+                                  [--checkpoint PATH] [--restart]
+
+`precompute` plans the next day for every user whose profile has
+`default_windows`, so the evening `/plan_day` rush is served from stored
+plans instead of scheduling and calling the LLM per request:
+
+1. The parent walks all user ids in chunks and takes a small snapshot per
+   user (summary text + scored candidates, see
+   `PlannerAgent.precompute_snapshots`).
+2. Snapshots are planned and summarised by the LLM on a process pool.
+3. The parent stores each result as a precomputed plan, adds the tokens
+   the worker spent to its own TokenMeter and appends the user to a
+   checkpoint file, so an interrupted run resumes where it stopped.
+
+The job runs next to the server, so both must use the same SQLite store
+(STUDYFLOW_STORE_BACKEND=sqlite); the server picks up the stored plans
+when it re-checks those users (see SQLiteBackend).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import date, timedelta
+from itertools import islice
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.domain import orchestrator
+from app.domain.agents.planner_agent import build_day_plan
+from app.domain.memory import store
+from app.domain.memory.backends import SQLiteBackend
+from app.llm.budget import TOKEN_METER
+from app.llm.tools import PLAN_SUMMARY, generate_plan_summary
+
+# Snapshots in flight per worker; bounds the parent's memory.
+IN_FLIGHT_PER_WORKER = 4
+
+
+def _plan_snapshot(snapshot: Dict[str, Any]) -> Tuple[str, list, str, Dict[str, int]]:
+    """
+    Worker: blocks and LLM summary for one user's snapshot, and the token
+    counters the summary added (the worker's own meter is not reported).
+    """
+    user_id = snapshot["user_id"]
+    before = TOKEN_METER.user_stats(user_id) or {}
+    blocks, _ = build_day_plan(snapshot)
+    summary = generate_plan_summary(snapshot["profile_summary"], blocks, user_id)
+    after = TOKEN_METER.user_stats(user_id) or {}
+    usage = {name: count - before.get(name, 0) for name, count in after.items()}
+    return user_id, blocks, summary, usage
+
+
+def _load_checkpoint(path: str, date_str: str) -> Set[str]:
+    """User ids already handled for `date_str` (empty if the file is for another date)."""
+    if not os.path.exists(path):
+        return set()
+    done: Set[str] = set()
+    with open(path, "r", encoding="utf-8") as f:
+        header = f.readline()
+        if not header or json.loads(header).get("date") != date_str:
+            return set()
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    done.add(json.loads(line)["user_id"])
+                except (ValueError, KeyError):
+                    # A line cut off by a crash; that user is redone
+                    continue
+    return done
+
+
+def run_precompute(
+    date_str: Optional[str] = None,
+    processes: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    restart: bool = False,
+    progress_every: int = 100,
+) -> Dict[str, Any]:
+    """
+    Precompute `date_str`'s plans (default: tomorrow) for all users.
+    Returns counts of planned / skipped / failed / resumed users and the
+    LLM calls and tokens spent.
+    """
+    if not isinstance(store.get_backend(), SQLiteBackend):
+        # An in-memory store belongs to this process: it holds no users and
+        # the server would never see the plans
+        raise RuntimeError(
+            "precompute needs the shared SQLite store; set STUDYFLOW_STORE_BACKEND=sqlite "
+            "and the server's STUDYFLOW_SQLITE_PATH"
+        )
+    date_str = date_str or (date.today() + timedelta(days=1)).isoformat()
+    processes = processes or os.cpu_count() or 1
+    checkpoint_path = checkpoint_path or f"precompute-{date_str}.jsonl"
+
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = _load_checkpoint(checkpoint_path, date_str)
+    if not done:
+        with open(checkpoint_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"date": date_str}) + "\n")
+
+    user_ids = [uid for uid in sorted(store.list_user_ids()) if uid not in done]
+    counts = {"planned": 0, "skipped": 0, "failed": 0, "resumed": len(done)}
+    tokens = {"llm_calls": 0, "prompt_tokens": 0, "output_tokens": 0}
+    total = len(user_ids)
+    started = time.perf_counter()
+
+    def report(final: bool = False) -> None:
+        handled = counts["planned"] + counts["skipped"] + counts["failed"]
+        if not final and (handled == 0 or handled % progress_every):
+            return
+        elapsed = time.perf_counter() - started
+        rate = handled / elapsed if elapsed else 0.0
+        eta = (total - handled) / rate if rate else 0.0
+        print(
+            f"[precompute {date_str}] {handled}/{total} users "
+            f"({counts['planned']} planned, {counts['skipped']} skipped, "
+            f"{counts['failed']} failed), {rate:.1f} users/s, eta {eta:.0f}s",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    planner = orchestrator.planner_agent
+    memory = orchestrator.memory_agent
+    pending: Dict[Future, Tuple[str, Dict[str, Any]]] = {}  # -> (user_id, plan key)
+    queue = iter(user_ids)
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, ProcessPoolExecutor(processes) as pool:
+        # Start on a fresh line in case a crash cut the last record short
+        checkpoint.write("\n")
+
+        def mark_done(user_id: str, status: str) -> None:
+            counts[status] += 1
+            checkpoint.write(json.dumps({"user_id": user_id, "status": status}) + "\n")
+            checkpoint.flush()
+            report()
+
+        def mark_failed(user_id: str, error: Exception) -> None:
+            # Not checkpointed, so a resumed run retries this user
+            counts["failed"] += 1
+            print(f"[precompute {date_str}] {user_id}: {type(error).__name__}: {error}", file=sys.stderr)
+            report()
+
+        def fill() -> None:
+            # Keep the pool busy without snapshotting every user up front
+            while len(pending) < processes * IN_FLIGHT_PER_WORKER:
+                chunk = list(islice(queue, processes * IN_FLIGHT_PER_WORKER - len(pending)))
+                if not chunk:
+                    return
+                snapshots, errors = planner.precompute_snapshots(chunk, date_str)
+                for user_id in chunk:
+                    if user_id in errors:
+                        mark_failed(user_id, errors[user_id])
+                        continue
+                    snapshot = snapshots[user_id]
+                    if snapshot is None:
+                        mark_done(user_id, "skipped")
+                        continue
+                    pending[pool.submit(_plan_snapshot, snapshot)] = (user_id, snapshot["plan_key"])
+
+        fill()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                user_id, key = pending.pop(future)
+                try:
+                    _, blocks, summary, usage = future.result()
+                except Exception as e:
+                    mark_failed(user_id, e)
+                    continue
+                # Spent even if the plan cannot be stored
+                TOKEN_METER.add(PLAN_SUMMARY, user_id, usage)
+                for name in tokens:
+                    tokens[name] += usage.get(name, 0)
+                try:
+                    memory.save_plan(user_id, date_str, blocks, summary, precomputed=key)
+                except Exception as e:
+                    mark_failed(user_id, e)
+                    continue
+                mark_done(user_id, "planned")
+            fill()
+
+    store.flush()
+    report(final=True)
+    return {**counts, **tokens}
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.main")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pre = commands.add_parser("precompute", help="Precompute next-day plans for all users")
+    pre.add_argument("--date", help="Date to plan (YYYY-MM-DD), default tomorrow")
+    pre.add_argument("--processes", type=int, help="Worker processes, default CPU count")
+    pre.add_argument("--checkpoint", help="Checkpoint file, default precompute-<date>.jsonl")
+    pre.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    pre.add_argument("--progress-every", type=int, default=100, help="Report every N users")
+
+    args = parser.parse_args(argv)
+    if args.command == "precompute":
+        counts = run_precompute(
+            date_str=args.date,
+            processes=args.processes,
+            checkpoint_path=args.checkpoint,
+            restart=args.restart,
+            progress_every=args.progress_every,
+        )
+        print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
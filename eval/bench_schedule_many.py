@@ -0,0 +1,104 @@
+# eval/bench_schedule_many.py
+
+"""
+Throughput benchmark: PlannerAgent.schedule_many vs a per-user loop.
+
+Sets up a synthetic cohort in the in-memory store (random tasks, effort
+estimates, default windows and spacing per user), then plans one day for
+everyone twice: once per user (`precompute_snapshot` + `build_day_plan`,
+as the precompute job did before) and once with `schedule_many`, which
+batches window merging and block counting. Both go through the same
+constraint scheduler; the benchmark checks that they produce the same
+blocks and reports users/second.
+
+The scheduler's local-search budget is raised so that every plan runs to
+convergence and the two paths are comparable block for block.
+
+Usage:
+    python eval/bench_schedule_many.py [USERS]
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+# Add project root to PYTHONPATH manually
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+os.environ["STUDYFLOW_STORE_BACKEND"] = "memory"
+os.environ.setdefault("STUDYFLOW_SCHEDULE_BUDGET_MS", "10000")
+
+from app.domain.agents.memory_agent import MemoryAgent
+from app.domain.agents.planner_agent import PlannerAgent, build_day_plan
+
+
+def _hhmm(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _cohort(memory: MemoryAgent, n: int, today: date, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    user_ids = []
+    for u in range(n):
+        user_id = f"bench-user-{u}"
+        tasks = [
+            {
+                "task_id": f"U{u}-T{i}",
+                "course_id": f"C{i % 4}",
+                "title": f"Task {i}",
+                "deadline_date": (today + timedelta(days=rng.randint(-2, 30))).isoformat(),
+                "estimated_minutes": rng.choice([0, 20, 45, 90, 180]),
+            }
+            for i in range(rng.randint(5, 40))
+        ]
+        windows = []
+        for _ in range(rng.randint(1, 4)):
+            start = rng.randint(7 * 60, 20 * 60)
+            end = min(start + rng.randint(30, 180), 24 * 60)
+            windows.append({"start": _hhmm(start), "end": _hhmm(end)})
+        profile = {
+            "default_windows": windows,
+            "preferred_block_minutes": rng.choice([30, 45, 60]),
+            "max_blocks_per_day": rng.randint(1, 5),
+            "gap_minutes": rng.choice([0, 0, 5, 10]),
+            "break_every": rng.choice([0, 2, 3]),
+            "break_minutes": rng.choice([15, 30]),
+        }
+        memory.setup_user(user_id=user_id, courses=[], tasks=tasks, profile_overrides=profile)
+        user_ids.append(user_id)
+    return user_ids
+
+
+def main(n: int = 5_000) -> None:
+    date_str = "2025-11-28"
+    memory = MemoryAgent()
+    planner = PlannerAgent(memory)
+    user_ids = _cohort(memory, n, date.fromisoformat(date_str))
+
+    t0 = time.perf_counter()
+    looped = {}
+    for user_id in user_ids:
+        snapshot = planner.precompute_snapshot(user_id, date_str)
+        looped[user_id] = build_day_plan(snapshot)
+    loop_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batched = planner.schedule_many(user_ids, date_str)
+    batch_s = time.perf_counter() - t0
+
+    assert {u: blocks for u, (blocks, _) in batched.items()} == {u: blocks for u, (blocks, _) in looped.items()}, \
+        "schedule_many and the per-user loop disagree"
+
+    print(f"Users: {n}, blocks: {sum(len(blocks) for blocks, _ in batched.values())}")
+    print(f"{'path':<24}{'seconds':>10}{'users/s':>12}")
+    print(f"{'per-user loop':<24}{loop_s:>10.2f}{n / loop_s:>12.0f}")
+    print(f"{'schedule_many':<24}{batch_s:>10.2f}{n / batch_s:>12.0f}")
+    print(f"Speedup: {loop_s / batch_s:.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000)
@@ -0,0 +1,81 @@
+# eval/bench_task_memory.py
+
+"""
+Memory benchmark: dict tasks vs compact Task records.
+
+Builds N tasks both ways (ids and titles are created up front and shared,
+so only the per-task representation is measured), reports traced bytes
+per task, and times a deadline sort in each representation.
+
+Usage:
+    python eval/bench_task_memory.py [N]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+# Add project root to PYTHONPATH manually
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.domain.memory.records import Task, TaskStatus
+
+
+def _measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def main(n: int = 100_000) -> None:
+    start = date(2025, 11, 1)
+    task_ids = [f"C{i % 40:03d}-TASK-{i:06d}" for i in range(n)]
+    titles = [f"Study unit {i % 500}" for i in range(n)]
+    course_ids = [f"C{i % 40:03d}" for i in range(n)]
+    deadlines = [start + timedelta(days=i % 120) for i in range(n)]
+
+    def build_dicts():
+        return [
+            {
+                "task_id": task_ids[i],
+                "course_id": course_ids[i],
+                "title": titles[i],
+                "deadline_date": deadlines[i].isoformat(),
+                "status": "pending",
+            }
+            for i in range(n)
+        ]
+
+    def build_records():
+        return [
+            Task(task_ids[i], course_ids[i], titles[i], deadlines[i].toordinal(), TaskStatus.PENDING)
+            for i in range(n)
+        ]
+
+    dict_tasks, dict_bytes = _measure(build_dicts)
+    record_tasks, record_bytes = _measure(build_records)
+
+    t0 = time.perf_counter()
+    sorted(dict_tasks, key=lambda t: datetime.strptime(t["deadline_date"], "%Y-%m-%d"))
+    dict_sort = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    sorted(record_tasks, key=lambda t: t.deadline)
+    record_sort = time.perf_counter() - t0
+
+    print(f"Tasks: {n}")
+    print(f"{'representation':<16}{'total MB':>10}{'bytes/task':>12}{'sort ms':>10}")
+    print(f"{'dict':<16}{dict_bytes / 1e6:>10.1f}{dict_bytes / n:>12.0f}{dict_sort * 1e3:>10.1f}")
+    print(f"{'Task record':<16}{record_bytes / 1e6:>10.1f}{record_bytes / n:>12.0f}{record_sort * 1e3:>10.1f}")
+    print(f"Memory saved: {1 - record_bytes / dict_bytes:.0%}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
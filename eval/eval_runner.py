@@ -8,6 +8,7 @@ ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if ROOT_DIR not in sys.path:
     sys.path.insert(0, ROOT_DIR)
 
+from app.domain.memory.records import Task
 from app.domain.tools.scheduling_tool import schedule_day
 
 def demo():
@@ -32,7 +33,7 @@ def demo():
         {"start": "19:00", "end": "21:00"},
     ]
 
-    blocks = schedule_day(tasks, date_str, available_windows)
+    blocks = schedule_day([Task.from_dict(t) for t in tasks], date_str, available_windows)
     print("Planned study blocks:")
     for b in blocks:
         print(b)
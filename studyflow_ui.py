@@ -373,6 +373,56 @@ def api_post(endpoint: str, payload: dict):
         return None, str(e)
 
 
+def api_stream(endpoint: str, payload: dict):
+    """
+    POST to a server-sent-events endpoint and yield (event, data) pairs as
+    they arrive. Errors are yielded as ("error", message).
+    """
+    try:
+        with requests.post(
+            st.session_state.base_url.rstrip("/") + endpoint,
+            json=payload, stream=True, timeout=(5, 30),
+        ) as r:
+            r.raise_for_status()
+            event = "message"
+            # chunk_size=None: hand over each event as soon as it arrives
+            for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):])
+                    event = "message"
+    except requests.exceptions.ConnectionError:
+        yield "error", "Cannot reach the backend. Is uvicorn running?"
+    except requests.exceptions.Timeout:
+        yield "error", "Request timed out (>30 s between events)."
+    except requests.exceptions.HTTPError as e:
+        yield "error", f"Server error {e.response.status_code}: {e.response.text[:200]}"
+    except Exception as e:
+        yield "error", str(e)
+
+
+def render_blocks(blocks: list) -> str:
+    """HTML rows for planned study blocks (values escaped)."""
+    rows = []
+    for b in blocks:
+        p_class = "priority-high" if b.get("priority") == "high" else "priority-low"
+        rows.append(f"""
+        <div class="task-row">
+            <div>
+                <div class="task-title">{h(b.get("title", "Untitled"))}</div>
+                <div class="task-sub">{h(b.get("course_id", ""))} &middot; {h(b.get("start_time", ""))}–{h(b.get("end_time", ""))}</div>
+            </div>
+            <span class="{p_class}">{h(b.get("priority", ""))}</span>
+        </div>""")
+    return "".join(rows) or '<div class="task-sub">No study blocks fit these windows.</div>'
+
+
+def ai_box(text: str) -> str:
+    # h() escapes API-returned text so it cannot inject HTML/JS into the page
+    return f'<div class="ai-response"><p>{h(text)}</p></div>'
+
+
 def api_get(endpoint: str, params=None):
     try:
         r = requests.get(
@@ -683,19 +733,25 @@ elif st.session_state.page == "plan":
             # Rotate session ID ready for next plan
             st.session_state.plan_session_id = str(uuid.uuid4())[:8]
 
-            with st.spinner("Generating your plan..."):
-                result, err = api_post("/plan_day", payload)
-            if err:
-                st.error(err)
-            else:
-                plan_text = (
-                    result.get("plan") or result.get("message") or json.dumps(result, indent=2)
-                ) if isinstance(result, dict) else str(result)
-                # h() escapes API-returned text so it cannot inject HTML/JS into the page
-                st.markdown(
-                    f'<div class="ai-response"><p>{h(plan_text)}</p></div>',
-                    unsafe_allow_html=True,
-                )
+            # Blocks arrive right after scheduling; the summary streams in after
+            blocks_slot  = st.empty()
+            summary_slot = st.empty()
+            blocks_slot.info("Scheduling...")
+            summary = ""
+            for event, data in api_stream("/plan_day_stream", payload):
+                if event == "error":
+                    blocks_slot.error(data)
+                    break
+                if event == "plan":
+                    blocks_slot.markdown(
+                        '<div class="section-label">Study Blocks</div>'
+                        + render_blocks(data.get("planned_blocks", [])),
+                        unsafe_allow_html=True,
+                    )
+                    summary_slot.markdown(ai_box("Writing your plan summary..."), unsafe_allow_html=True)
+                elif event == "summary":
+                    summary += data.get("text", "")
+                    summary_slot.markdown(ai_box(summary), unsafe_allow_html=True)
 
 # ─── REFLECT ──────────────────────────────────────────────────────────────────
 elif st.session_state.page == "reflect":
@@ -731,18 +787,18 @@ elif st.session_state.page == "reflect":
                 "notes":              notes or "",
                 "date":               str(reflect_date),
             }
-            with st.spinner("Processing..."):
-                result, err = api_post("/reflect", payload)
-            if err:
-                st.error(err)
-            else:
-                feedback = (
-                    result.get("feedback") or result.get("message") or json.dumps(result, indent=2)
-                ) if isinstance(result, dict) else str(result)
-                st.markdown(
-                    f'<div class="ai-response"><p>{h(feedback)}</p></div>',
-                    unsafe_allow_html=True,
-                )
+            feedback_slot = st.empty()
+            feedback_slot.info("Saving your reflection...")
+            feedback = ""
+            for event, data in api_stream("/reflect_stream", payload):
+                if event == "error":
+                    feedback_slot.error(data)
+                    break
+                if event == "reflection":
+                    feedback_slot.markdown(ai_box("Reflection saved. Writing feedback..."), unsafe_allow_html=True)
+                elif event == "feedback":
+                    feedback += data.get("text", "")
+                    feedback_slot.markdown(ai_box(feedback), unsafe_allow_html=True)
 
 # ─── STATUS ───────────────────────────────────────────────────────────────────
 elif st.session_state.page == "status":